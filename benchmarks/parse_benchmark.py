@@ -0,0 +1,76 @@
+"""
+Compares the columnar TableBuilder to the old one-DataFrame-per-record + concat approach for pulling tables out of an
+FFI export. Run from the base directory of the project:
+
+    python -m benchmarks.parse_benchmark --rows 100000
+"""
+import argparse
+import time
+import xml.etree.ElementTree as ET
+from uuid import uuid4
+from pandas import DataFrame, concat
+from parser.builder import TableBuilder
+from parser.functions import strip_namespace
+
+NAMESPACE = 'http://tempuri.org/FFI.xsd'
+
+
+def synthetic_export(n_rows):
+    """
+    makes a small FFI-like export with n_rows AttributeData records. Every tenth record leaves out the value, so the
+    rows are ragged like real exports.
+    """
+    root = ET.Element(f'{{{NAMESPACE}}}FFIExport')
+    for i in range(n_rows):
+        record = ET.SubElement(root, f'{{{NAMESPACE}}}AttributeData')
+        ET.SubElement(record, f'{{{NAMESPACE}}}AttributeData_DataRow_ID').text = str(i // 10)
+        ET.SubElement(record, f'{{{NAMESPACE}}}AttributeData_MethodAtt_ID').text = str(i % 10)
+        ET.SubElement(record, f'{{{NAMESPACE}}}AttributeData_SampleRow_ID').text = str(i // 100)
+        ET.SubElement(record, f'{{{NAMESPACE}}}AttributeData_Original_GUID').text = str(uuid4())
+        if i % 10 != 0:
+            ET.SubElement(record, f'{{{NAMESPACE}}}AttributeData_Value').text = str(i * 0.5)
+
+    return root
+
+
+def concat_path(root):
+    dfs = [
+        DataFrame({strip_namespace(attr.tag): [attr.text] for attr in data_set})
+        for data_set in root
+    ]
+    return concat(dfs).reset_index(drop=True)
+
+
+def builder_path(root):
+    builder = TableBuilder()
+    for data_set in root:
+        builder.add_row({strip_namespace(attr.tag): attr.text for attr in data_set})
+    return builder.to_frame()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--rows', type=int, default=50000, help='number of AttributeData records to generate')
+    args = arg_parser.parse_args()
+
+    root = synthetic_export(args.rows)
+
+    timings = {}
+    frames = {}
+    for name, func in [('concat', concat_path), ('builder', builder_path)]:
+        start = time.perf_counter()
+        frames[name] = func(root)
+        timings[name] = time.perf_counter() - start
+
+    # both paths should give the same table, other than None vs NaN for the missing values
+    same = frames['concat'].fillna('').equals(frames['builder'].fillna(''))
+
+    print(f"{args.rows} rows")
+    for name, seconds in timings.items():
+        print(f"  {name:<8} {seconds:8.3f} s")
+    print(f"  speedup  {timings['concat'] / timings['builder']:8.1f}x")
+    print(f"  same output: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Runs the whole pipeline (FFIFile.extract, transform and load) on synthetic exports of a few sizes, and records the wall
+time, CPU time, peak memory and rows of each stage. Loads go into a SQLite stand-in for the FFI database, with a table
+for each table in TableMap.csv and the columns from FieldMap.csv. Run from the base directory of the project:
+
+    python -m benchmarks.pipeline_benchmark --rows 1000 100000 1000000 --output results.json
+
+Each size runs in its own process, so peak memory is just that size's. Pass --baseline with the results of an earlier
+run to flag stages that got slower, e.g. before and after a change:
+
+    python -m benchmarks.pipeline_benchmark --rows 100000 --baseline results.json
+
+Synthetic exports are kept in --workdir (a temp directory by default) and reused when the same size and seed is asked
+for again. At 10M values, the XML is around 2 GB.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from sqlalchemy import Column, ForeignKey, MetaData, Table, create_engine
+from sqlalchemy.types import DateTime, Float, String
+from benchmarks.synthetic_export import write_export
+from parser.mapping import get_registry
+from parser.server import FFIDatabase
+
+# primary keys for the stand-in tables. The real database's keys aren't in the repo, so these are the natural keys of
+# the synthetic data.
+STANDIN_KEYS = {
+    'AdminUnit': ['AdminUnit'],
+    'Plot': ['PlotID'],
+    'Event': ['EventID'],
+    'Project': ['ProjectID'],
+    'ProjectVisit': ['VisitID'],
+    'Transect': ['EventID', 'TransNum'],
+    'FuelsFine': ['EventID', 'Transect'],
+    'Fuels1000Hr': ['EventID', 'Transect', 'LogNum'],
+    'FuelsDuffLitter': ['EventID', 'Transect', 'SampleLoc'],
+    'FuelsVegetation': ['EventID', 'Transect', 'SampleLoc'],
+    'TreesIndv': ['EventID', 'TagNum', 'StemNum'],
+    'TreesSaplings': ['EventID', 'Species', 'SizeClassDiam', 'Status'],
+    'TreesSeedlings': ['EventID', 'Species', 'SizeClassHt', 'Status'],
+}
+
+# foreign keys for the stand-in tables, so the load plan has the same levels as against the real database
+STANDIN_REFERENCES = {
+    'AdminUnit': ('AdminUnit', 'AdminUnit'),
+    'PlotID': ('Plot', 'PlotID'),
+    'EventID': ('Event', 'EventID'),
+    'ProjectID': ('Project', 'ProjectID'),
+}
+
+
+def _column_type(values):
+    """
+    the SQL type for a stand-in column, going by the values that will be loaded into it
+    """
+    values = values.dropna()
+    if len(values) > 0 and pd.to_numeric(values, errors='coerce').notna().all():
+        return Float()
+    return String(255)
+
+
+def create_standin_db(engine, ffi_data):
+    """
+    Creates a table for each table the export loads into, with the columns from FieldMap. Columns are typed by the
+    data that goes into them (numbers as floats, dates as datetimes, the rest as strings), since the real column types
+    aren't in the repo either.
+
+    :param engine: SQLAlchemy Engine (SQLite)
+    :param ffi_data: transformed FFIFile, to see which tables get loaded and what's in them
+    :return: FFIDatabase for the stand-in
+    """
+    mappings = get_registry()
+    meta = MetaData()
+    for table, df in ffi_data._data_map.items():
+        table_name = mappings.target_table(table)
+        if table_name not in STANDIN_KEYS or table_name in meta.tables:
+            continue
+
+        keys = STANDIN_KEYS[table_name]
+        columns = []
+        for old_col, col in mappings.field_map(table_name).items():
+            if old_col not in df.columns:
+                continue
+            if 'Date' in col:
+                col_type = DateTime()
+            else:
+                col_type = _column_type(df[old_col])
+            references = STANDIN_REFERENCES.get(col)
+            args = [ForeignKey(f'{references[0]}.{references[1]}')] if references and references[0] != table_name \
+                else []
+            columns.append(Column(col, col_type, *args, primary_key=col in keys))
+        Table(table_name, meta, *columns)
+
+    meta.create_all(engine)
+    return FFIDatabase(engine)
+
+
+def run_one(n_values, workdir, seed=0, batch_size=None, trace_memory=False):
+    """
+    generates (or reuses) a synthetic export and runs it through the pipeline. Meant to be run in its own process.
+
+    :return: dict with the size, the export's file size and the stage records from the FFIFile's StageMetrics
+    """
+    # parser.xml sets up logging to a file when it's imported; setting it up first keeps the benchmark's log on the
+    # console instead
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING, format='%(levelname)s - %(message)s')
+    from parser.xml import FFIFile
+
+    os.environ.setdefault('USERNAME', 'benchmark')
+    xml_path = os.path.join(workdir, f'synthetic_{n_values}_{seed}.xml')
+    if not os.path.isfile(xml_path):
+        start = time.perf_counter()
+        write_export(xml_path, n_values, seed=seed)
+        print(f"Generated {xml_path} in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    db_path = os.path.join(workdir, f'standin_{n_values}_{seed}.sqlite')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    engine = create_engine(f'sqlite:///{db_path}')
+
+    ffi_data = FFIFile(xml_path, streaming=True)
+    traced = {}
+
+    def run_stage(stage, func):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        func()
+        if trace_memory:
+            traced[stage] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+
+    if trace_memory:
+        tracemalloc.start()
+    run_stage('extract', ffi_data.extract)
+    run_stage('transform', ffi_data.transform)
+    ffi_db = create_standin_db(engine, ffi_data)
+    run_stage('load', lambda: ffi_data.load(ffi_db, batch_size=batch_size))
+    if trace_memory:
+        tracemalloc.stop()
+
+    stages = ffi_data.metrics.to_dict()['stages']
+    for record in stages:
+        if record['parent'] is None and record['stage'] in traced:
+            record['traced_peak_mb'] = traced[record['stage']]
+    engine.dispose()
+
+    return {'values': n_values, 'seed': seed, 'xml_mb': round(os.path.getsize(xml_path) / 2 ** 20, 1),
+            'failed_tables': ffi_data.insert_failed, 'stages': stages}
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: list of (values, stage, baseline seconds, seconds) for stages that got slower by more than tolerance
+    """
+    base_times = {(run['values'], record['stage']): record['wall_s']
+                  for run in baseline for record in run['stages'] if record['parent'] is None}
+    regressions = []
+    for run in results:
+        for record in run['stages']:
+            key = (run['values'], record['stage'])
+            if record['parent'] is None and key in base_times and record['wall_s'] > base_times[key] * (1 + tolerance):
+                regressions.append((run['values'], record['stage'], base_times[key], record['wall_s']))
+    return regressions
+
+
+def print_run(run):
+    print(f"{run['values']} attribute values ({run['xml_mb']} MB of XML)")
+    print(f"  {'stage':<56} {'wall s':>8} {'cpu s':>8} {'peak MB':>9} {'traced MB':>10} {'rows in':>9} {'rows out':>9}")
+    for record in run['stages']:
+        name = record['stage'] if record['parent'] is None else f"  {record['stage']}"
+        traced = record.get('traced_peak_mb')
+        print(f"  {name:<56} {record['wall_s']:>8.2f} {record['cpu_s']:>8.2f} "
+              f"{record['peak_rss_mb'] if record['peak_rss_mb'] is not None else '':>9} "
+              f"{traced if traced is not None else '':>10} "
+              f"{record['rows_in'] if record['rows_in'] is not None else '':>9} "
+              f"{record['rows_out'] if record['rows_out'] is not None else '':>9}")
+    if run['failed_tables']:
+        print(f"  failed tables: {', '.join(run['failed_tables'])}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='sizes to run, in AttributeData values')
+    arg_parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic exports')
+    arg_parser.add_argument('--batch-size', type=int, default=None, help='rows per MERGE when loading')
+    arg_parser.add_argument('--trace-memory', action='store_true',
+                            help="also record each stage's peak Python/numpy allocations with tracemalloc. This slows "
+                                 "everything down, so don't compare the timings to runs without it.")
+    arg_parser.add_argument('--workdir', default=None, help='where to keep the synthetic exports and databases')
+    arg_parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    arg_parser.add_argument('--baseline', default=None, help='JSON results of an earlier run to compare against')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='how much slower (as a fraction) a stage can get before it counts as a regression')
+    args = arg_parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ffi_benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    try:
+        for n_values in args.rows:
+            # a fresh process for each size, so the peak memory of one doesn't carry over to the next
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                run = pool.submit(run_one, n_values, workdir, args.seed, args.batch_size, args.trace_memory).result()
+            results.append(run)
+            print_run(run)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as open_file:
+            json.dump(results, open_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as open_file:
+            baseline = json.load(open_file)
+        regressions = compare(results, baseline, args.tolerance)
+        for n_values, stage, before, after in regressions:
+            print(f"Regression: {stage} at {n_values} values took {after:.2f} s, up from {before:.2f} s")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compares pivoting the long AttributeData table one method at a time (masking the whole table for every method) to
+grouping it once with pivot_by_group. Run from the base directory of the project:
+
+    python -m benchmarks.pivot_benchmark --rows 2000000
+"""
+import argparse
+import time
+from uuid import uuid4
+import numpy as np
+from pandas import DataFrame
+from parser.pivot import pivot_by_group
+
+INDEX = ['EventID', 'SampleData_SampleEvent_GUID', 'AttributeData_DataRow_GUID', 'Method_UnitSystem']
+
+# (method, unit systems, attribute fields, share of the data rows) - roughly the shape of a real FFI export, where
+# trees and fuels make up most of the data
+METHODS = [
+    ('Trees - Individuals', ['English'], ['Spp_GUID', 'TagNo', 'DBH', 'Status', 'CrwnRto', 'Damage', 'Comment'], 0.30),
+    ('Surface Fuels - Fine', ['English', 'Metric'], ['Transect', 'Azimuth', 'Slope', 'OneHr', 'TenHr', 'HunHr'], 0.15),
+    ('Surface Fuels - 1000Hr', ['English', 'Metric'], ['Transect', 'LogNum', 'Dia', 'DecayCl'], 0.12),
+    ('Surface Fuels - Duff_Litter', ['English', 'Metric'], ['Transect', 'SampLoc', 'LittDep', 'DuffDep'], 0.10),
+    ('Surface Fuels - Vegetation', ['English'], ['Transect', 'SampLoc', 'LiveWoody', 'DeadWoody', 'LiveHerb'], 0.08),
+    ('Cover - Points (metric)', ['Metric'], ['Transect', 'Point', 'Tape', 'Order', 'Height', 'Spp_GUID'], 0.15),
+    ('Trees - Saplings (Diameter Class)', ['English'], ['Spp_GUID', 'SizeCl', 'Status', 'Count', 'AvgHt'], 0.06),
+    ('Post Burn Severity', ['English'], ['Transect', 'Point', 'Sub', 'Veg', 'Comment'], 0.03),
+    ('Plot Info Wit Trees Comments3', ['English'], ['WitTreeTagNo', 'WitDBH', 'WitAzimuth', 'WitDistance'], 0.01),
+]
+
+
+def synthetic_attributes(n_rows, n_events=2000, seed=0):
+    """
+    makes a long AttributeData table like the one _attr_to_many pivots, with about n_rows rows. Each data row gets one
+    value per field of its method, and every twentieth value is left out.
+    """
+    rng = np.random.default_rng(seed)
+    events = [str(uuid4()).upper() for _ in range(n_events)]
+    frames = []
+    for method, unit_systems, fields, share in METHODS:
+        n_data_rows = max(int(n_rows * share / len(fields)), 1)
+        event_idx = rng.integers(0, n_events, n_data_rows)
+        data_rows = np.array([str(uuid4()).upper() for _ in range(n_data_rows)], dtype=object)
+        units = np.array(unit_systems, dtype=object)[rng.integers(0, len(unit_systems), n_data_rows)]
+        n_fields = len(fields)
+        frame = DataFrame({
+            'EventID': np.repeat(np.array([f'EV{i}' for i in event_idx], dtype=object), n_fields),
+            'SampleData_SampleEvent_GUID': np.repeat(np.array(events, dtype=object)[event_idx], n_fields),
+            'AttributeData_DataRow_GUID': np.repeat(data_rows, n_fields),
+            'MethodAtt_FieldName': np.tile(np.array(fields, dtype=object), n_data_rows),
+            'AttributeData_Value': rng.random(n_data_rows * n_fields).round(2).astype(str).astype(object),
+            'Method_Name': method,
+            'Method_UnitSystem': np.repeat(units, n_fields),
+        })
+        frames.append(frame.iloc[np.arange(len(frame)) % 20 != 0])
+
+    # shuffle so methods are interleaved like they are in an export
+    long_df = DataFrame(np.concatenate([f.to_numpy() for f in frames]), columns=frames[0].columns)
+    return long_df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def masked_path(long_df):
+    tables = {}
+    for method in long_df['Method_Name'].unique():
+        temp = long_df.loc[long_df['Method_Name'] == method].drop_duplicates()
+        tables[method] = temp.pivot(index=INDEX, columns=['MethodAtt_FieldName'],
+                                    values='AttributeData_Value').reset_index()
+    return tables
+
+
+def grouped_path(long_df):
+    return dict(pivot_by_group(long_df, 'Method_Name', index=INDEX, columns='MethodAtt_FieldName',
+                               values='AttributeData_Value', drop_duplicates=True))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--rows', type=int, default=2000000, help='number of AttributeData rows to generate')
+    args = arg_parser.parse_args()
+
+    long_df = synthetic_attributes(args.rows)
+
+    timings = {}
+    tables = {}
+    for name, func in [('masked', masked_path), ('grouped', grouped_path)]:
+        start = time.perf_counter()
+        tables[name] = func(long_df)
+        timings[name] = time.perf_counter() - start
+
+    same = tables['masked'].keys() == tables['grouped'].keys() and all(
+        tables['masked'][method].equals(tables['grouped'][method]) for method in tables['masked']
+    )
+
+    print(f"{len(long_df)} rows, {len(tables['grouped'])} methods")
+    for name, seconds in timings.items():
+        print(f"  {name:<8} {seconds:8.3f} s")
+    print(f"  speedup  {timings['masked'] / timings['grouped']:8.1f}x")
+    print(f"  same output: {same}")
+
+
+if __name__ == "__main__":
+    main()
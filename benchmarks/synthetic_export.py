@@ -0,0 +1,294 @@
+"""
+Writes a synthetic FFI export for benchmarking, since real exports have sensitive data in them. The export has the
+same tables and relationships the parser relies on (RegistrationUnit -> MacroPlot -> SampleEvent, projects and
+monitoring statuses, and Method/MethodAttribute/AttributeRow/AttributeData and SampleAttribute/SampleRow/SampleData for
+the protocols), with fuels protocols in both English and Metric. Run from the base directory of the project:
+
+    python -m benchmarks.synthetic_export data/synthetic.xml --rows 1000000
+
+The XML is written as it's generated, so exports with 10M+ attribute values don't need to fit in memory.
+"""
+import argparse
+import random
+from uuid import UUID
+from xml.sax.saxutils import escape
+
+NAMESPACE = 'http://tempuri.org/FFI.xsd'
+
+SPECIES = ['PIPO', 'PSME', 'ABCO', 'QUGA', 'JUMO', 'PIED', 'POTR5', 'ACGL', 'BOGR2', 'CAREX']
+COMMENTS = ['', '', '', '', 'Tag missing, re-tagged', 'Leaning <30 deg', 'Fire scar & cat face', 'Check "dead" status']
+TRANSECTS = range(1, 5)
+
+# fields that are sometimes left blank. The rest identify the row (or are needed to build other tables), so they're
+# always there.
+OPTIONAL_FIELDS = {'Ht', 'CrwnRto', 'CrwnCl', 'DamCd1', 'Comment', 'DecayCl', 'FuelbedDep', 'Height', 'AvgHt', 'AgeCl'}
+
+
+def _trees(rng):
+    return [{'TagNo': str(tag), 'Spp_GUID': rng.randrange(len(SPECIES)), 'DBH': f'{rng.uniform(2, 40):.1f}',
+             'Ht': f'{rng.uniform(5, 120):.0f}', 'Status': rng.choice('LLLLD'), 'CrwnRto': str(rng.randint(1, 9) * 10),
+             'CrwnCl': rng.choice('DCIS'), 'DamCd1': rng.choice(['', '', 'BROK', 'FIRE', 'INSE']),
+             'Comment': rng.choice(COMMENTS)}
+            for tag in range(1, rng.randint(5, 25) + 1)]
+
+
+def _fine(rng):
+    return [{'Transect': str(tran), 'Azimuth': str(rng.randint(0, 359)), 'Slope': str(rng.randint(0, 45)),
+             'OneHr': str(rng.randint(0, 30)), 'TenHr': str(rng.randint(0, 15)), 'HunHr': str(rng.randint(0, 5)),
+             'Comment': rng.choice(COMMENTS)}
+            for tran in TRANSECTS]
+
+
+def _thousand_hr(rng):
+    return [{'Transect': str(tran), 'LogNum': str(log), 'Dia': f'{rng.uniform(3, 20):.1f}',
+             'DecayCl': str(rng.randint(1, 5))}
+            for tran in TRANSECTS for log in range(1, rng.randint(1, 5) + 1)]
+
+
+def _duff(rng):
+    return [{'Transect': str(tran), 'SampLoc': str(loc), 'OffSet': str(loc * 5), 'LittDep': f'{rng.uniform(0, 3):.1f}',
+             'DuffDep': f'{rng.uniform(0, 4):.1f}', 'FuelbedDep': f'{rng.uniform(0, 10):.1f}'}
+            for tran in TRANSECTS for loc in range(1, 6)]
+
+
+def _vegetation(rng):
+    return [{'Transect': str(tran), 'SampLoc': str(loc), 'OffSet': str(loc * 10), 'Item': rng.choice('LD'),
+             'Cover': str(rng.randint(0, 100)), 'Height': f'{rng.uniform(0, 3):.1f}'}
+            for tran in TRANSECTS for loc in range(1, 3)]
+
+
+def _size_classes(rng, size_field, extra):
+    rows = []
+    for species in rng.sample(range(len(SPECIES)), rng.randint(1, 3)):
+        for size_class in range(1, rng.randint(1, 3) + 1):
+            row = {'Spp_GUID': species, size_field: str(size_class), 'Status': 'L',
+                   'Count': str(rng.randint(1, 40)), 'SubFrac': '1'}
+            row.update(extra(rng))
+            rows.append(row)
+    return rows
+
+
+def _saplings(rng):
+    return _size_classes(rng, 'SizeClDia', lambda r: {'AvgHt': f'{r.uniform(1, 4):.1f}'})
+
+
+def _seedlings(rng):
+    return _size_classes(rng, 'SizeClHt', lambda r: {'AgeCl': r.choice(['', 'N', 'O'])})
+
+
+# (method name, unit systems, function making the attribute rows for one event)
+METHODS = [
+    ('Trees - Individuals', ['English'], _trees),
+    ('Trees - Saplings (Diameter Class)', ['English'], _saplings),
+    ('Trees - Seedlings (Height Class)', ['English'], _seedlings),
+    ('Surface Fuels - Fine', ['English', 'Metric'], _fine),
+    ('Surface Fuels - 1000Hr', ['English', 'Metric'], _thousand_hr),
+    ('Surface Fuels - Duff_Litter', ['English', 'Metric'], _duff),
+    ('Surface Fuels - Vegetation', ['English'], _vegetation),
+]
+SAMPLE_FIELDS = ['FieldTeam', 'EntryTeam']
+CREW = ['Smith', 'Jones', 'Lee', 'Garcia', 'Chen', 'Patel']
+
+# (prefix, base, suffix) of the monitoring statuses each project cycles its visits through
+STATUSES = [('00', 'PR', None), ('01', 'Fire', 'Immediate'), ('01', 'Post', None), ('02', 'Post', None),
+            ('05', 'Post', None), ('10', 'Post', None)]
+
+# about how many attribute values one event has, for working out how many events to make
+VALUES_PER_EVENT = 400
+
+
+class ExportWriter:
+    """
+    Writes records to an FFI export one at a time, counting how many go into each table
+    """
+
+    def __init__(self, open_file):
+        self.open_file = open_file
+        self.counts = {}
+
+    def record(self, table, fields):
+        """
+        :param table: table name (the record element's tag)
+        :param fields: dict of {field: value}; None values are left out, like FFI does
+        """
+        parts = [f'<{table}>']
+        for field, value in fields.items():
+            if value is not None:
+                parts.append(f'<{field}>{escape(str(value))}</{field}>')
+        parts.append(f'</{table}>\n')
+        self.open_file.write(''.join(parts))
+        self.counts[table] = self.counts.get(table, 0) + 1
+
+
+class _Ids:
+    """
+    GUIDs and integer IDs from a seeded rng, so the same seed always writes the same export
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.counters = {}
+
+    def guid(self):
+        return str(UUID(int=self.rng.getrandbits(128), version=4))
+
+    def next(self, name):
+        self.counters[name] = self.counters.get(name, -1) + 1
+        return str(self.counters[name])
+
+
+def write_export(path, n_values, seed=0, admin_unit='Synthetic Forest Unit', metric_share=0.2, events_per_plot=4):
+    """
+    writes a synthetic export with about n_values AttributeData values (anywhere from a few thousand to tens of
+    millions)
+
+    :param path: where to write the XML
+    :param n_values: about how many AttributeData records to write
+    :param seed: random seed; the same seed and arguments always give the same file
+    :param admin_unit: name of the RegistrationUnit
+    :param metric_share: share of the events whose fuels protocols are recorded in metric
+    :param events_per_plot: visits per plot
+    :return: dict with the number of records written to each table
+    """
+    rng = random.Random(seed)
+    ids = _Ids(rng)
+    n_events = max(-(-n_values // VALUES_PER_EVENT), 1)
+    n_plots = max(-(-n_events // events_per_plot), 1)
+    with open(path, 'w', encoding='utf-8') as open_file:
+        open_file.write('<?xml version="1.0" standalone="yes"?>\n')
+        open_file.write(f'<FFIExport xmlns="{NAMESPACE}">\n')
+        writer = ExportWriter(open_file)
+        record = writer.record
+
+        record('Schema_Version', {'Schema_Version': '20.1'})
+        reg_guid = ids.guid()
+        record('RegistrationUnit', {'RegistrationUnit_GUID': reg_guid, 'RegistrationUnit_Name': admin_unit,
+                                    'RegistrationUnit_Comment': 'Synthetic export for benchmarking'})
+
+        species = []
+        for symbol in SPECIES:
+            spp_guid = ids.guid()
+            species.append(spp_guid)
+            record('LocalSpecies', {'LocalSpecies_GUID': spp_guid, 'LocalSpecies_Symbol': symbol})
+
+        # one Method per protocol and unit system, each with its own attribute and sample fields
+        methods = {}
+        for name, unit_systems, make_rows in METHODS:
+            fields = list(make_rows(random.Random(0))[0])
+            for unit_system in unit_systems:
+                method_guid = ids.guid()
+                record('Method', {'Method_GUID': method_guid, 'Method_Name': name, 'Method_UnitSystem': unit_system})
+                att_ids = {}
+                for field in fields:
+                    att_ids[field] = ids.next('MethodAtt')
+                    record('MethodAttribute', {'MethodAtt_ID': att_ids[field], 'MethodAtt_Method_GUID': method_guid,
+                                               'MethodAtt_FieldName': field})
+                sample_ids = {}
+                for field in SAMPLE_FIELDS:
+                    sample_ids[field] = ids.next('SampleAtt')
+                    record('SampleAttribute', {'SampleAtt_ID': sample_ids[field],
+                                               'SampleAtt_Method_GUID': method_guid, 'SampleAtt_FieldName': field})
+                methods[name, unit_system] = (att_ids, sample_ids)
+
+        # a project for every 50 plots, each with the same set of monitoring statuses
+        projects = []
+        for project in range(max(-(-n_plots // 50), 1)):
+            project_guid = ids.guid()
+            record('ProjectUnit', {'ProjectUnit_GUID': project_guid, 'ProjectUnit_Name': f'Burn Unit_{project + 1}',
+                                   'ProjectUnit_RegistrationUnit_GUID': reg_guid, 'ProjectUnit_Agency': 'NPS',
+                                   'ProjectUnit_Area': str(rng.randint(50, 5000)),
+                                   'ProjectUnit_DateIn': '2005-03-01T00:00:00-07:00',
+                                   'ProjectUnit_Objective': 'Reduce surface fuels'})
+            statuses = []
+            for order, (prefix, base, suffix) in enumerate(STATUSES):
+                status_guid = ids.guid()
+                status_name = ' '.join(part for part in (prefix, base, suffix) if part)
+                record('MonitoringStatus', {'MonitoringStatus_GUID': status_guid,
+                                            'MonitoringStatus_ProjectUnit_GUID': project_guid,
+                                            'MonitoringStatus_Prefix': prefix, 'MonitoringStatus_Base': base,
+                                            'MonitoringStatus_Suffix': suffix, 'MonitoringStatus_Name': status_name,
+                                            'MonitoringStatus_Order': str(order)})
+                statuses.append((status_guid, status_name))
+            projects.append((project_guid, statuses))
+
+        event_number = 0
+        for plot in range(n_plots):
+            plot_guid = ids.guid()
+            project_guid, statuses = projects[plot // 50]
+            record('MacroPlot', {'MacroPlot_GUID': plot_guid, 'MacroPlot_Name': f'FPIPO1D{plot + 1:05d}',
+                                 'MacroPlot_RegistrationUnit_GUID': reg_guid,
+                                 'MacroPlot_DateIn': '2005-03-01T00:00:00-07:00', 'MacroPlot_Type': 'Forest',
+                                 'MacroPlot_Aspect': str(rng.randint(0, 359)),
+                                 'MacroPlot_SlopeHill': str(rng.randint(0, 45)),
+                                 'MacroPlot_Elevation': str(rng.randint(1500, 3000)), 'MacroPlot_Datum': 'NAD83',
+                                 'MacroPlot_DD_Lat': f'{rng.uniform(35, 37):.6f}',
+                                 'MacroPlot_DD_Long': f'{rng.uniform(-106, -104):.6f}'})
+            record('MM_ProjectUnit_MacroPlot', {'MM_ProjectUnit_GUID': project_guid, 'MM_MacroPlot_GUID': plot_guid})
+
+            for visit in range(events_per_plot):
+                if event_number >= n_events:
+                    break
+                event_guid = ids.guid()
+                status_guid, status_name = statuses[visit % len(statuses)]
+                record('SampleEvent', {'SampleEvent_GUID': event_guid, 'SampleEvent_Plot_GUID': plot_guid,
+                                       'SampleEvent_Date': f'{2006 + visit * 2}-{rng.randint(5, 9):02d}-'
+                                                           f'{rng.randint(1, 28):02d}T00:00:00-06:00',
+                                       'SampleEvent_DefaultMonitoringStatus': status_name,
+                                       'SampleEvent_Who': ', '.join(rng.sample(CREW, 2)),
+                                       'SampleEvent_Comment': rng.choice(COMMENTS) or None})
+                record('MM_MonitoringStatus_SampleEvent', {'MM_MonitoringStatus_GUID': status_guid,
+                                                           'MM_SampleEvent_GUID': event_guid})
+
+                metric = event_number > 0 and rng.random() < metric_share
+                for name, unit_systems, make_rows in METHODS:
+                    unit_system = 'Metric' if metric and 'Metric' in unit_systems else 'English'
+                    att_ids, sample_ids = methods[name, unit_system]
+
+                    sample_row = ids.next('SampleRow')
+                    record('SampleRow', {'SampleRow_ID': sample_row, 'SampleRow_Original_GUID': ids.guid(),
+                                         'SampleRow_CreatedBy': 'benchmark',
+                                         'SampleRow_CreatedDate': '2020-01-01T00:00:00-07:00'})
+                    for field, sample_att in sample_ids.items():
+                        record('SampleData', {'SampleData_SampleRow_ID': sample_row,
+                                              'SampleData_SampleEvent_GUID': event_guid,
+                                              'SampleData_SampleAtt_ID': sample_att,
+                                              'SampleData_Value': '/'.join(rng.sample(CREW, rng.randint(1, 2)))})
+
+                    for values in make_rows(rng):
+                        data_row = ids.next('AttributeRow')
+                        record('AttributeRow', {'AttributeRow_ID': data_row, 'AttributeRow_DataRow_GUID': ids.guid(),
+                                                'AttributeRow_Original_GUID': ids.guid()})
+                        for field, value in values.items():
+                            if field == 'Spp_GUID':
+                                value = species[value].lower()
+                            # blank values just aren't in the export, and every so often an optional one is left out
+                            if value == '' or (field in OPTIONAL_FIELDS and rng.random() < 0.05):
+                                continue
+                            record('AttributeData', {'AttributeData_DataRow_ID': data_row,
+                                                     'AttributeData_MethodAtt_ID': att_ids[field],
+                                                     'AttributeData_SampleRow_ID': sample_row,
+                                                     'AttributeData_Value': value})
+                event_number += 1
+
+        open_file.write('</FFIExport>\n')
+
+    return writer.counts
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('path', help='where to write the export')
+    arg_parser.add_argument('--rows', type=int, default=100000, help='about how many AttributeData values to write')
+    arg_parser.add_argument('--seed', type=int, default=0, help='random seed')
+    arg_parser.add_argument('--metric-share', type=float, default=0.2,
+                            help='share of events whose fuels data is in metric')
+    args = arg_parser.parse_args()
+
+    counts = write_export(args.path, args.rows, seed=args.seed, metric_share=args.metric_share)
+    print(f"Wrote {sum(counts.values())} records to {args.path}")
+    for table, count in counts.items():
+        print(f"  {table:<34} {count:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+from pandas import DataFrame
+
+
+class TableBuilder:
+    """
+    Collects the records of a single FFI table as per-column lists so the table can be made into one DataFrame at the
+    end, rather than making a one-row DataFrame for every record and concatenating them all.
+    """
+
+    def __init__(self):
+        self._columns = {}
+        self._n_rows = 0
+
+    def __len__(self):
+        return self._n_rows
+
+    def add_row(self, record):
+        """
+        adds one record to the table. Records don't always have the same fields (FFI leaves out empty ones), so any
+        field we haven't seen before gets backfilled for the earlier rows, and any field this record is missing gets a
+        None.
+
+        :param record: dict of {field name: value} for the row
+        """
+        columns = self._columns
+        for field, value in record.items():
+            if field not in columns:
+                columns[field] = [None] * self._n_rows
+            columns[field].append(value)
+
+        self._n_rows += 1
+        if len(record) < len(columns):
+            for values in columns.values():
+                if len(values) < self._n_rows:
+                    values.append(None)
+
+    def to_frame(self):
+        """
+        :return: the collected rows as a DataFrame, with columns in the order they first showed up
+        """
+        return DataFrame(self._columns)
@@ -0,0 +1,179 @@
+import glob
+import json
+import logging
+import os
+import shutil
+import time
+from hashlib import sha256
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # the cache is optional and needs pyarrow; without it nothing gets cached
+    feather = None
+
+PARSER_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def code_version():
+    """
+    a hash of the parser source code, so cached tables made by older code don't get used
+    """
+    code_hash = sha256()
+    for path in sorted(glob.glob(os.path.join(PARSER_PATH, '*.py'))):
+        with open(path, 'rb') as open_file:
+            code_hash.update(open_file.read())
+    return code_hash.hexdigest()[:16]
+
+
+def file_hash(path):
+    """
+    SHA-256 of the whole file, read in chunks so big exports don't need to fit in memory
+    """
+    file_sha = sha256()
+    with open(path, 'rb') as open_file:
+        for chunk in iter(lambda: open_file.read(1 << 20), b''):
+            file_sha.update(chunk)
+    return file_sha.hexdigest()
+
+
+class ExportCache:
+    """
+    An on-disk cache of an FFIFile's data map after extract (and, optionally, after transform), stored as one Feather
+    file per table. Entries are keyed by the hash of the XML file and the version of the code, so a file that failed to
+    load can be picked back up without parsing the XML again.
+
+    Old entries are evicted by age and by the total size of the cache.
+    """
+
+    _attributes = ['version', 'admin_unit', 'many_tables', '_namespace', 'unknown_species']
+
+    def __init__(self, directory, max_age_days=None, max_size_mb=None):
+        """
+        :param directory: where to keep the cache
+        :param max_age_days: entries older than this are deleted
+        :param max_size_mb: the oldest entries are deleted until the cache is smaller than this
+        """
+        self.directory = directory
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+        self._version = code_version()
+        self._file_keys = {}
+
+    @staticmethod
+    def available():
+        return feather is not None
+
+    def _entry_path(self, ffi_file, stage):
+        source = ffi_file._source
+        stat = os.stat(source)
+        # hashing a multi-GB file isn't free, so only do it once per file per run
+        file_id = (source, stat.st_size, stat.st_mtime)
+        if file_id not in self._file_keys:
+            self._file_keys[file_id] = file_hash(source)
+        return os.path.join(self.directory, f'{self._file_keys[file_id]}_{self._version}_{stage}')
+
+    def restore(self, ffi_file, stage):
+        """
+        Fills in an FFIFile's data map from the cache.
+
+        :param ffi_file: the FFIFile to fill in
+        :param stage: 'extract' or 'transform'
+        :return: True if there was a cache entry, False otherwise
+        """
+        if not self.available():
+            return False
+
+        entry = self._entry_path(ffi_file, stage)
+        meta_path = os.path.join(entry, 'meta.json')
+        if not os.path.isfile(meta_path):
+            return False
+
+        with open(meta_path) as open_file:
+            meta = json.load(open_file)
+
+        data_map = {}
+        for idx, table in enumerate(meta['tables']):
+            # to_pandas copies everything (the files are compressed, and strings become Python objects), so memory
+            # mapping only saves reading each compressed file into its own buffer first
+            df = feather.read_table(os.path.join(entry, f'{idx}.feather'), memory_map=True).to_pandas()
+            data_map[table] = df.set_index('__index__').rename_axis(None)
+        ffi_file._data_map = data_map
+        for attribute in self._attributes:
+            setattr(ffi_file, attribute, meta['attributes'][attribute])
+
+        os.utime(meta_path)  # so eviction goes by when an entry was last used
+        print(f"Read {stage} tables for {ffi_file.file} from the cache")
+        logging.info(f"Read {stage} tables for {ffi_file.file} from {entry}")
+        return True
+
+    def store(self, ffi_file, stage):
+        """
+        Writes an FFIFile's data map to the cache, then evicts old entries. Tables that can't be written (e.g. columns
+        mixing numbers and text) mean the entry is skipped; it's a cache, so that only costs time on the next run.
+
+        :param ffi_file: the FFIFile to cache
+        :param stage: 'extract' or 'transform'
+        """
+        if not self.available():
+            return
+
+        entry = self._entry_path(ffi_file, stage)
+        temp_entry = f'{entry}.tmp'
+        shutil.rmtree(temp_entry, ignore_errors=True)
+        os.makedirs(temp_entry)
+
+        try:
+            tables = list(ffi_file._data_map)
+            for idx, table in enumerate(tables):
+                df = ffi_file._data_map[table]
+                df = df.rename_axis('__index__').reset_index()
+                df.columns = [str(col) for col in df.columns]
+                feather.write_feather(df, os.path.join(temp_entry, f'{idx}.feather'))
+
+            meta = {'file': ffi_file.file,
+                    'stage': stage,
+                    'code_version': self._version,
+                    'created': time.time(),
+                    'tables': tables,
+                    'attributes': {attribute: getattr(ffi_file, attribute) for attribute in self._attributes}}
+            with open(os.path.join(temp_entry, 'meta.json'), 'w') as open_file:
+                json.dump(meta, open_file, default=str)
+        except Exception:
+            logging.exception(f"Couldn't cache the {stage} tables for {ffi_file.file}")
+            shutil.rmtree(temp_entry, ignore_errors=True)
+            return
+
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(temp_entry, entry)
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes entries that are older than max_age_days, then the least recently used entries until the cache fits in
+        max_size_mb.
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            meta_path = os.path.join(entry, 'meta.json')
+            if not os.path.isfile(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(meta_path), size, entry))
+        entries.sort()
+
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            for entry in [e for e in entries if e[0] < cutoff]:
+                shutil.rmtree(entry[2], ignore_errors=True)
+                entries.remove(entry)
+
+        if self.max_size_mb is not None:
+            total = sum(size for _, size, _ in entries)
+            while entries and total > self.max_size_mb * 1024 * 1024:
+                _, size, path = entries.pop(0)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
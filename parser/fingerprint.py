@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+_store_lock = threading.Lock()
+
+
+class FingerprintStore:
+    """
+    A SQLite sidecar file holding a content hash for every row we've inserted, keyed by table and primary key.
+    Comparing a transformed export's final rows against it tells us which rows are new or have changed since they were
+    inserted, so the rest don't get sent to the database again. The whole export still goes through transform.
+
+    Only the path is kept on the object (connections are opened as needed), so it can go along with an FFIFile to a
+    worker process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    table_name TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    row_hash INTEGER NOT NULL,
+                    PRIMARY KEY (table_name, row_key)
+                )
+            """)
+
+    def _connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return sqlite3.connect(self.path, timeout=60)
+
+    @staticmethod
+    def row_keys(df, key_cols):
+        """
+        :return: Series of string keys made from the key columns (joined with '|' when there's more than one)
+        """
+        keys = df[key_cols[0]].astype(str)
+        for col in key_cols[1:]:
+            keys = keys + '|' + df[col].astype(str)
+        return keys
+
+    @staticmethod
+    def row_hashes(df):
+        """
+        :return: Series of 64-bit hashes of each row's contents (as signed ints, which is what SQLite stores)
+        """
+        return pd.util.hash_pandas_object(df.astype(str), index=False).astype('int64')
+
+    def _stored(self, table_name):
+        with self._connect() as conn:
+            stored = pd.read_sql("SELECT row_key, row_hash FROM fingerprints WHERE table_name = ?", conn,
+                                 params=(table_name,))
+        return stored.set_index('row_key')['row_hash']
+
+    def changed(self, table_name, keys, hashes):
+        """
+        :param table_name: the table the rows belong to
+        :param keys: Series of row keys (from row_keys)
+        :param hashes: Series of row hashes (from row_hashes), with the same index as keys
+        :return: boolean Series, True for rows that are new or whose contents changed
+        """
+        stored = keys.map(self._stored(table_name))
+        return stored.isna() | (stored != hashes)
+
+    def save(self, table_name, keys, hashes):
+        """
+        records the hashes of rows that made it into the database
+        """
+        if len(keys) == 0:
+            return
+        rows = list(zip([table_name] * len(keys), keys.tolist(), hashes.tolist()))
+        with _store_lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO fingerprints (table_name, row_key, row_hash) VALUES (?, ?, ?)",
+                             rows)
@@ -1,7 +1,10 @@
 from re import findall, sub
 from datetime import date
+from functools import lru_cache
 from dateutil import parser
-from pandas import isna
+from dateutil.tz import tzlocal
+import numpy as np
+from pandas import isna, to_datetime, Series, NaT, DataFrame, concat
 
 
 def create_url(**kwargs):
@@ -88,6 +91,153 @@ def convert_datetime(datetime):
         return datetime
 
 
+@lru_cache(maxsize=None)
+def _parse_datetime_cached(datetime):
+    """
+    slow path for values pd.to_datetime can't read: parse with dateutil the same way convert_datetime does and return
+    naive local time. Memoized, since the irregular values tend to repeat.
+    """
+    value = parser.parse(datetime)
+    if value.tzinfo is None:
+        # already local, like the fast path assumes. astimezone would go through a timestamp, which overflows on dates
+        # like 9999-12-31
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+
+def _format_sql_datetime_value(value):
+    """
+    format_sql_datetime for a single datetime. The slow path's values are often outside what datetime64 can hold (e.g.
+    the 0001-01-01 FFI uses for "no date"), so they get formatted as Python datetimes instead.
+    """
+    return value.isoformat(timespec='milliseconds' if value.microsecond else 'seconds')
+
+
+def _utc_to_local(utc_series):
+    """
+    converts a UTC datetime Series to naive local time. Converting with tz_convert(tzlocal()) goes value by value, so
+    instead this looks up the local offset once per distinct hour (offsets only change on the hour) and adds it.
+    """
+    local_tz = tzlocal()
+    hours = utc_series.dt.floor('h')
+    offsets = {hour: hour.to_pydatetime().astimezone(local_tz).utcoffset() for hour in hours.dropna().unique()}
+    return utc_series.dt.tz_localize(None) + hours.map(offsets).astype('timedelta64[ns]')
+
+
+def format_sql_datetime(dt_series):
+    """
+    formats a datetime64 Series as strings SQL Server will take, i.e. 'YYYY-MM-DDTHH:MM:SS' with milliseconds appended
+    when there are any. Sub-millisecond digits are truncated, same as convert_datetime.
+
+    :param dt_series: Series of (timezone-naive) datetime64 values
+    :return: Series of strings
+    """
+    base = dt_series.dt.strftime('%Y-%m-%dT%H:%M:%S')
+    micro = dt_series.dt.microsecond
+    millis = '.' + (micro // 1000).astype(str).str.zfill(3)
+    return base.where(micro == 0, base + millis)
+
+
+def convert_datetime_series(series):
+    """
+    vectorized version of convert_datetime for a whole column. Timestamps with a UTC offset are converted to local time
+    and have the offset dropped; timestamps without one are taken as already being local. Anything pd.to_datetime
+    can't read falls back to dateutil.
+
+    :param series: Series of datetime strings from the XML (missing values are left alone)
+    :return: Series of SQL Server-compatible datetime strings
+    """
+    result = series.astype(object)
+    present = series.notna()
+    if not present.any():
+        return result
+
+    values = series[present].astype(str)
+    has_tz = values.str.contains(r'(?:Z|[+-]\d{2}:?\d{2})$', regex=True)
+
+    parsed = Series(NaT, index=values.index, dtype='datetime64[ns]')
+    if has_tz.any():
+        aware = to_datetime(values[has_tz], format='ISO8601', utc=True, errors='coerce')
+        parsed[has_tz] = _utc_to_local(aware)
+    if (~has_tz).any():
+        parsed[~has_tz] = to_datetime(values[~has_tz], format='ISO8601', errors='coerce')
+
+    result[present] = format_sql_datetime(parsed)
+
+    # anything to_datetime couldn't read (odd formats, or years outside 1677-2262) goes through dateutil and gets
+    # formatted on its own, since it may not fit in a datetime64 column
+    irregular = parsed.isna()
+    if irregular.any():
+        fallback = values[irregular].map(_parse_datetime_cached).map(_format_sql_datetime_value)
+        result[fallback.index] = fallback
+    return result
+
+
+def split_name_lists(df, columns):
+    """
+    Splits columns of free-text name lists (e.g. "J. Smith, A. Jones" or "JS/AJ") into one row per name. Each value is
+    split on commas if it has any, otherwise on spaces, otherwise on slashes. Blank names are dropped.
+
+    :param df: DataFrame with the name columns
+    :param columns: the columns to split
+    :return: DataFrame with 'row' (position of the row in df), 'column' and 'name', in row, column, then name order
+    """
+    longs = []
+    for col_order, col in enumerate(columns):
+        values = df[col].reset_index(drop=True)
+        values = values[values.notna()].astype(str)
+        values = values[~values.isin(['', ' ', 'nan'])]
+
+        has_comma = values.str.contains(',', regex=False)
+        has_space = values.str.contains(' ', regex=False)
+        # put everything on commas, so one split handles all three cases
+        normalized = values.where(has_comma | ~has_space, values.str.replace(' ', ',', regex=False))
+        normalized = normalized.where(has_comma | has_space, normalized.str.replace('/', ',', regex=False))
+
+        names = normalized.str.split(',').explode().str.strip()
+        longs.append(DataFrame({'row': names.index, 'col_order': col_order, 'column': col, 'name': names.values}))
+
+    long_df = concat(longs, ignore_index=True)
+    long_df = long_df.loc[long_df['name'].notna() & (long_df['name'] != '')]
+    long_df = long_df.sort_values(['row', 'col_order'], kind='stable')
+    return long_df[['row', 'column', 'name']].reset_index(drop=True)
+
+
+def join_name_lists(names, columns, n_rows):
+    """
+    Combines the names from split_name_lists for a group of columns into one comma-separated list per row, without
+    duplicates. Names are kept in the order they first show up, so the output is the same every time.
+
+    :param names: output of split_name_lists
+    :param columns: the columns to combine
+    :param n_rows: number of rows in the original DataFrame
+    :return: Series of combined names (empty string if there aren't any), indexed by row position
+    """
+    subset = names.loc[names['column'].isin(columns)].drop_duplicates(['row', 'name'], keep='first')
+    joined = subset.groupby('row', sort=False)['name'].agg(', '.join)
+    return joined.reindex(np.arange(n_rows), fill_value='')
+
+
+def normalize_id_part(names):
+    """
+    drops spaces, underscores, dashes and periods from names and upper-cases the rest, the way they go into PlotIDs
+
+    :param names: Series of names
+    :return: Series of normalized names
+    """
+    return names.str.replace(r'[ _\-.]', '', regex=True).str.upper()
+
+
+def plot_id_prefix(admin_names):
+    """
+    PlotIDs (and so EventIDs) start with the first five characters of the normalized admin unit name
+
+    :param admin_names: Series of RegistrationUnit names
+    :return: Series of the PlotID prefix for each
+    """
+    return normalize_id_part(admin_names).str[:5]
+
+
 def to_datenum(datetime):
     """
     convert a date to a datetime value (number of seconds since Jan 1, 1900, I think) in the format that SQLServer uses.
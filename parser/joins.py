@@ -0,0 +1,163 @@
+from pandas import Index, concat
+
+_JOIN_KEY = '__join_key__'
+
+
+class _Input:
+    """
+    One table in a JoinChain: the base table, or a table being left joined on
+    """
+
+    def __init__(self, df, left_on=None, right_on=None):
+        self.df = df
+        self.left_on = left_on
+        self.right_on = right_on
+        self.keep = []  # columns this table needs to bring along, in the table's own column order
+        self.children = []  # joins keyed on one of this table's columns
+
+
+class JoinChain:
+    """
+    A chain of left joins onto one base table, the same as base.merge(a, how='left', ...).merge(b, how='left', ...),
+    except the joins are planned before anything is run:
+
+    - each table is cut down to the columns that are actually asked for, plus the keys the later joins need, so the
+      intermediate frames are only as wide as the result
+    - joins keyed on a joined table's column (e.g. Method onto MethodAttribute) are done on that table before it gets
+      joined onto the base, so they run against the small table instead of the big one
+    - the right-hand side of each join is indexed on its key, and lookups that can't add rows (unique keys) go before
+      joins that can, smallest first
+
+    With distinct=True, only the distinct rows of the result matter to the caller (e.g. it drops duplicates next), so
+    joined tables are de-duplicated after they're cut down, and joins that don't bring any needed columns are skipped.
+    Rows come out in the same order as the merge chain would give them, less any duplicates that were dropped early.
+    """
+
+    def __init__(self, base, distinct=False):
+        """
+        :param base: DataFrame everything gets joined onto
+        :param distinct: if True, the result may skip duplicate rows (see above)
+        """
+        self._base = _Input(base)
+        self._joins = []
+        self._built = {}
+        self.distinct = distinct
+
+    def left_join(self, df, left_on, right_on):
+        """
+        adds a left join to the chain, like .merge(df, left_on=left_on, right_on=right_on, how='left')
+
+        :param df: DataFrame to join
+        :param left_on: key column in the base table or in a table joined earlier in the chain
+        :param right_on: key column in df
+        :return: this JoinChain, so joins can be chained
+        """
+        self._joins.append(_Input(df, left_on, right_on))
+        return self
+
+    def _plan(self, columns):
+        """
+        works out which columns each table has to bring and which table each join goes onto
+        """
+        inputs = [self._base] + self._joins
+        for table in inputs:
+            table.keep = []
+            table.children = []
+
+        # the first table with a column is where it comes from, same as which column would come out of the merges
+        # without a suffix
+        providers = {}
+        for table in inputs:
+            for col in table.df.columns:
+                providers.setdefault(col, table)
+
+        needed = {id(table): set() for table in inputs}
+        for col in columns:
+            if col not in providers:
+                raise KeyError(col)
+            needed[id(providers[col])].add(col)
+
+        # back to front, since a join can only use keys from the tables before it
+        for join in reversed(self._joins):
+            if not needed[id(join)] and self.distinct:
+                continue
+            parent = providers[join.left_on]
+            needed[id(parent)].add(join.left_on)
+            parent.children.insert(0, join)
+
+        for table in inputs:
+            table.keep = [col for col in table.df.columns if col in needed[id(table)]]
+
+    def _build(self, table, df=None):
+        """
+        cuts a table down to its columns and runs the joins onto it
+
+        :param table: the _Input to build
+        :param df: rows to use instead of the table's own (see _join)
+        :return: DataFrame, indexed on the join key for anything but the base table
+        """
+        df = table.df if df is None else df
+        if table is self._base:
+            frame = df[table.keep]
+        else:
+            frame = df[[table.right_on] + [col for col in table.keep if col != table.right_on]]
+            if self.distinct:
+                frame = frame.drop_duplicates()
+
+        # lookups that can't add rows go first, by size, so the intermediate frames stay as small as they can be.
+        # Joins that can add rows keep their order, so the rows come out in the same order as the merge chain.
+        children = []
+        for order, child in enumerate(table.children):
+            if id(child) not in self._built:
+                self._built[id(child)] = (self._build(child), self._build(child, child.df.iloc[:0].reindex([0])))
+            child_frame, null_rows = self._built[id(child)]
+            fan_out = max(len(child_frame) / max(child_frame.index.nunique(dropna=False), 1), len(null_rows))
+            rank = (0, len(child_frame), order) if fan_out <= 1 else (1, order, 0)
+            children.append((rank, child, child_frame, null_rows))
+        for _, child, child_frame, null_rows in sorted(children, key=lambda item: item[0]):
+            frame = self._join(frame, child, child_frame, null_rows)
+
+        if table is not self._base:
+            frame = frame.set_index(table.right_on, drop=table.right_on not in table.keep)
+        return frame
+
+    @staticmethod
+    def _join(frame, child, child_frame, null_rows):
+        """
+        left joins a built table onto frame. In the merge chain, a row that doesn't match gets nulls for the joined
+        table's columns, and those nulls then get looked up in the tables joined onto it (pandas matches null keys to
+        null keys). Joining the child's own joins first skips that, so unmatched rows get null_rows instead: what an
+        all-null row of the child turns into, which is just nulls unless one of those tables has null keys.
+        """
+        if len(null_rows) == 1 and null_rows.isna().all(axis=None):
+            return frame.join(child_frame, on=child.left_on, how='left')
+
+        keys = frame[child.left_on]
+        unmatched = ~keys.isin(child_frame.index)
+        if child_frame.index.hasnans:
+            # join matches any null key to any null key, but isin doesn't match NaN to None
+            unmatched &= keys.notna()
+        if not unmatched.any():
+            return frame.join(child_frame, on=child.left_on, how='left')
+
+        # send the unmatched rows to the null rows instead
+        no_match = object()
+        null_rows.index = Index([no_match] * len(null_rows))
+        child_frame = concat([child_frame, null_rows])
+        join_keys = keys.astype(object).where(~unmatched, no_match)
+        frame = frame.assign(**{_JOIN_KEY: join_keys}).join(child_frame, on=_JOIN_KEY, how='left')
+        return frame.drop(columns=_JOIN_KEY)
+
+    def execute(self, columns):
+        """
+        runs the joins
+
+        :param columns: columns wanted in the result, from any of the tables
+        :return: DataFrame with just those columns, with a fresh index
+        """
+        self._plan(columns)
+        self._built = {}  # id of a joined table -> (its built frame, its null rows), so each is only built once
+        try:
+            return self._build(self._base)[list(columns)].reset_index(drop=True)
+        finally:
+            self._built = {}
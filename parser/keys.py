@@ -0,0 +1,152 @@
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from parser.fingerprint import FingerprintStore
+from parser.functions import plot_id_prefix
+from parser.serialize import column_values
+
+# PlotIDs start with the first five characters of the normalized admin unit name, and EventIDs start with the PlotID
+# (see FFIFile._parse_idents), so tables keyed on them can be narrowed down to one admin unit by key prefix
+_PREFIXED_KEYS = ('PlotID', 'EventID')
+
+
+def typed_keys(df, table, pks):
+    """
+    Each row's primary key as a string, made from the key values converted to their column's type (see
+    serialize.column_values), so keys from the XML match the same keys read back from the database, e.g. '1' and 1.0.
+
+    :param df: DataFrame with the key columns
+    :param table: the SQLAlchemy Table the keys belong to
+    :param pks: names of the key columns
+    :return: Series of key strings (joined with '|' when there's more than one column), with the same index as df
+    """
+    typed = pd.DataFrame({pk: column_values(df[pk], table.columns[pk].type)[0] for pk in pks}, index=df.index,
+                         dtype=object)
+    return FingerprintStore.row_keys(typed, pks)
+
+
+class KeyCache:
+    """
+    The primary keys already in the database, read once per run for each table (and admin unit, where the table can be
+    narrowed down to one) and shared by every file loaded in the run. Rows whose keys are already there would just be
+    thrown away by the MERGE, so they're dropped before anything gets sent, and the network and MERGE time go with how
+    much new data there is instead of the size of the export.
+
+    Keys are kept as a sorted array of 64-bit hashes of the key strings (8 bytes a key, not a Python string), the same
+    kind of hash the FingerprintStore uses. Key values are converted to their column's type first (see typed_keys), the
+    same way they are when they're loaded, so e.g. '1' from the XML matches 1.0 read back from a float column. Keys
+    that are new to the cache are always sent, so anything else that makes a key look different locally (case,
+    trailing spaces) only means a row goes to the MERGE like it used to.
+
+    Keys inserted during the run get added as each table loads, so later files see them. Rows deleted from the database
+    by someone else during the run won't be noticed until the next run.
+    """
+
+    def __init__(self, ffi_db, chunk_size=100000):
+        """
+        :param ffi_db: FFIDatabase object representing the database connection
+        :param chunk_size: rows of keys to read from the database at a time
+        """
+        self.ffi_db = ffi_db
+        self.chunk_size = chunk_size
+        self._keys = {}  # (table name, admin unit or None) -> sorted uint64 array of key hashes
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _scope(self, table_name, admin_unit):
+        """
+        :return: the admin unit the table's keys can be narrowed down to, or None if the whole table has to be read
+        """
+        if admin_unit is None:
+            return None
+        columns = self.ffi_db.tables[table_name].columns
+        pks = self.ffi_db.get_primary_keys()[table_name]
+        if 'AdminUnit' in columns or (pks and pks[0] in _PREFIXED_KEYS):
+            return admin_unit
+        return None
+
+    def _hashes(self, table_name, df, pks):
+        """
+        :return: uint64 array of hashes of each row's key (see typed_keys)
+        """
+        if df.empty:
+            return np.empty(0, dtype='uint64')
+        keys = typed_keys(df, self.ffi_db.tables[table_name], pks)
+        return pd.util.hash_array(keys.to_numpy(dtype=object))
+
+    def _fetch(self, table_name, scope):
+        """
+        reads the keys of a table from the database, a chunk at a time so only the hashes are kept
+        """
+        table = self.ffi_db.tables[table_name]
+        pks = self.ffi_db.get_primary_keys()[table_name]
+        query = select(*[table.c[pk] for pk in pks])
+        if scope is not None:
+            if 'AdminUnit' in table.c:
+                query = query.where(table.c['AdminUnit'] == scope)
+            else:
+                prefix = plot_id_prefix(pd.Series([scope]))[0]
+                query = query.where(table.c[pks[0]].startswith(prefix, autoescape=True))
+
+        chunks = []
+        with self.ffi_db.engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True)
+            for chunk in pd.read_sql(query, conn, chunksize=self.chunk_size):
+                chunks.append(self._hashes(table_name, chunk, pks))
+        hashes = np.unique(np.concatenate(chunks)) if chunks else np.empty(0, dtype='uint64')
+
+        where = f" for {scope}" if scope is not None else ''
+        logging.info(f"Read {len(hashes)} existing keys of {table_name}{where}")
+        return hashes
+
+    def _existing(self, key):
+        """
+        :return: the key hashes for a (table name, scope), reading them from the database the first time
+        """
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # each table is only read once, but different tables can be read at the same time
+        with lock:
+            if key not in self._keys:
+                self._keys[key] = self._fetch(*key)
+            return self._keys[key]
+
+    def new_rows(self, table_name, df, admin_unit=None):
+        """
+        :param table_name: name of the table in the database
+        :param df: DataFrame whose columns are named after the columns of the database table
+        :param admin_unit: admin unit of the file being loaded, to only read that admin unit's keys where possible
+        :return: boolean Series, True for rows whose keys aren't in the database yet
+        """
+        pks = self.ffi_db.get_primary_keys()[table_name]
+        if not pks or any(pk not in df.columns for pk in pks):
+            return pd.Series(True, index=df.index)
+
+        existing = self._existing((table_name, self._scope(table_name, admin_unit)))
+        hashes = self._hashes(table_name, df, pks)
+        found = np.zeros(len(hashes), dtype=bool)
+        if len(existing) > 0:
+            positions = np.minimum(np.searchsorted(existing, hashes), len(existing) - 1)
+            found = existing[positions] == hashes
+        return pd.Series(~found, index=df.index)
+
+    def add(self, table_name, df, admin_unit=None):
+        """
+        records the keys of rows that are now in the database
+
+        :param table_name: name of the table in the database
+        :param df: DataFrame of the rows, with the database column names
+        :param admin_unit: admin unit of the file the rows came from
+        """
+        pks = self.ffi_db.get_primary_keys()[table_name]
+        if not pks or any(pk not in df.columns for pk in pks) or df.empty:
+            return
+
+        key = (table_name, self._scope(table_name, admin_unit))
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key in self._keys:
+                self._keys[key] = np.union1d(self._keys[key], self._hashes(table_name, df, pks))
@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import threading
+import time
+from sqlalchemy import text
+from parser.serialize import serialize_frame
+
+
+class BulkLoader:
+    """
+    Loads a DataFrame into a database table without building the data into the SQL itself. Rows are staged into a
+    temporary table with a parameterized executemany, and then the staging table is merged into the target table on
+    its primary keys so only rows that aren't already there get inserted.
+
+    SQL Server gets a MERGE INTO statement. Other dialects (SQLite, PostgreSQL, which we use as stand-ins for testing)
+    get the equivalent INSERT ... SELECT ... WHERE NOT EXISTS.
+
+    The primary keys of the inserted rows come back from the statement itself (OUTPUT on SQL Server, RETURNING where
+    the dialect has it), so there's no need to count the table before and after.
+
+    Values are converted to the types of the target table's columns before they're sent (see serialize_frame), so
+    numbers, dates, bits and GUIDs go over as native parameters rather than strings the server has to cast.
+    """
+
+    def __init__(self, ffi_db, batch_size=None):
+        """
+        :param ffi_db: FFIDatabase object representing the database connection
+        :param batch_size: number of rows per MERGE in load_batches. None loads each table in one batch.
+        """
+        self.ffi_db = ffi_db
+        self.batch_size = batch_size
+        self.bytes_sent = 0  # rough size of the SQL and parameters sent so far, for the load metrics
+
+    @staticmethod
+    def _staging_name(conn, table_name):
+        if conn.dialect.name == 'mssql':
+            return f'#stage_{table_name}'
+        return f'stage_{table_name}'
+
+    @staticmethod
+    def _drop_staging(conn, stage):
+        # a staging table can be left over on a pooled connection if an earlier load failed
+        if conn.dialect.name == 'mssql':
+            conn.execute(text(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}"))
+        else:
+            conn.execute(text(f"DROP TABLE IF EXISTS {stage}"))
+
+    def _create_staging(self, conn, table_name, stage, cols):
+        """
+        creates an empty temp table with the same column types as the target table
+        """
+        cols_str = ', '.join(cols)
+        if conn.dialect.name == 'mssql':
+            sql = f"SELECT {cols_str} INTO {stage} FROM {table_name} WHERE 1 = 0"
+        else:
+            sql = f"CREATE TEMPORARY TABLE {stage} AS SELECT {cols_str} FROM {table_name} WHERE 1 = 0"
+        conn.execute(text(sql))
+
+    @staticmethod
+    def _returns_keys(conn):
+        """
+        whether the merge statement can hand back the keys of the rows it inserted
+        """
+        return conn.dialect.name == 'mssql' or getattr(conn.dialect, 'insert_returning', False)
+
+    def _merge_sql(self, conn, table_name, stage, cols, pks):
+        cols_str = ', '.join(cols)
+        source_col_str = ', '.join(f'source.{c}' for c in cols)
+        pk_part = ' AND '.join(f'target.{pk} = source.{pk}' for pk in pks)
+
+        if conn.dialect.name == 'mssql':
+            output_str = ', '.join(f'inserted.{pk}' for pk in pks)
+            return f"""
+            MERGE INTO {table_name} AS target
+            USING {stage} AS source
+                ON {pk_part}
+            WHEN NOT MATCHED THEN
+                INSERT ({cols_str})
+                VALUES ({source_col_str})
+            OUTPUT {output_str};
+            """
+        else:
+            returning = f"RETURNING {', '.join(pks)}" if self._returns_keys(conn) else ''
+            return f"""
+            INSERT INTO {table_name} ({cols_str})
+            SELECT {source_col_str}
+            FROM {stage} AS source
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table_name} AS target
+                WHERE {pk_part}
+            )
+            {returning}
+            """
+
+    @staticmethod
+    def _payload_bytes(records):
+        """
+        rough size of the parameter values being sent: the length of each non-null value as a string
+        """
+        return int(sum(records[col].dropna().astype(str).str.len().sum() for col in records.columns))
+
+    def serialize(self, conn, table_name, df):
+        """
+        :param conn: SQLAlchemy Connection, to see whether the driver takes GUIDs natively
+        :param table_name: name of the table in the database
+        :param df: DataFrame whose columns are named after the columns of the database table
+        :return: DataFrame of Python values of each column's type, with None for nulls
+        """
+        return serialize_frame(df, self.ffi_db.tables[table_name], native_uuid=conn.dialect.name == 'mssql')
+
+    def load(self, conn, table_name, df):
+        """
+        Stages and merges the data. This runs on the connection it's given and doesn't commit, so it can be part of a
+        larger transaction.
+
+        :param conn: SQLAlchemy Connection (e.g. Session.connection())
+        :param table_name: name of the table in the database
+        :param df: DataFrame whose columns are named after the columns of the database table
+        :return: tuple of (number of rows inserted, list of primary key tuples of the inserted rows). The keys are None
+            if the dialect can't return them, in which case the count is the driver's rowcount.
+        """
+        if df.empty:
+            return 0, []
+        return self._load_records(conn, table_name, self.serialize(conn, table_name, df))
+
+    def _load_records(self, conn, table_name, records):
+        """
+        load() for data that's already been through serialize()
+        """
+        if records.empty:
+            return 0, []
+
+        preparer = conn.dialect.identifier_preparer
+        pks = self.ffi_db.get_primary_keys()[table_name]
+        cols = [preparer.quote(col) for col in records.columns]
+        quoted_pks = [preparer.quote(pk) for pk in pks]
+        target = preparer.quote(table_name)
+        stage = self._staging_name(conn, table_name)
+
+        self._drop_staging(conn, stage)
+        self._create_staging(conn, target, stage, cols)
+
+        # positional bind names, since column names aren't always valid bind parameter names
+        params = [f'p{idx}' for idx in range(len(cols))]
+        insert_sql = text(f"INSERT INTO {stage} ({', '.join(cols)}) VALUES ({', '.join(':' + p for p in params)})")
+        rows = [dict(zip(params, row)) for row in records.itertuples(index=False, name=None)]
+
+        # with mssql+pyodbc engines created with fast_executemany=True, this goes over in a single round trip
+        conn.execute(insert_sql, rows)
+
+        merge_sql = self._merge_sql(conn, target, stage, cols, quoted_pks)
+        self.bytes_sent += self._payload_bytes(records) + len(insert_sql.text) + len(merge_sql)
+        result = conn.execute(text(merge_sql))
+        if self._returns_keys(conn):
+            inserted_keys = [tuple(row) for row in result.fetchall()]
+            inserted = len(inserted_keys)
+        else:
+            inserted_keys = None
+            inserted = result.rowcount
+        self._drop_staging(conn, stage)
+
+        return inserted, inserted_keys
+
+    def load_batches(self, session, table_name, df, checkpoint=None, on_batch=None, on_commit=None):
+        """
+        Loads the data in chunks of batch_size rows, with one MERGE and one commit per chunk. If a checkpoint is given,
+        chunks it already has recorded as committed are skipped, and each chunk is recorded once it's committed. If a
+        chunk fails, the error is raised after that chunk is rolled back; the chunks before it stay in the database.
+
+        :param session: SQLAlchemy Session
+        :param table_name: name of the table in the database
+        :param df: DataFrame whose columns are named after the columns of the database table
+        :param checkpoint: optional LoadCheckpoint for the file being loaded
+        :param on_batch: optional function called as on_batch(conn, table_name, inserted, inserted_keys) after each
+            chunk is merged and before it's committed, so anything it writes (e.g. logs) goes in with the chunk
+        :param on_commit: optional function called as on_commit(table_name, chunk, inserted, inserted_keys) once each
+            chunk is committed, with the chunk as it was sent (see serialize)
+        :return: list of dicts with the batch number, rows sent, rows inserted, bytes sent and seconds taken for each
+            batch loaded
+        """
+        batch_size = self.batch_size or max(len(df), 1)
+        n_batches = -(-len(df) // batch_size)
+        first_batch = checkpoint.last_batch(table_name) + 1 if checkpoint else 0
+        if first_batch > 0:
+            print(f"Skipping {min(first_batch, n_batches)} batches of {table_name} that were already loaded.")
+            logging.info(f"Resuming {table_name} at batch {first_batch + 1} of {n_batches}")
+
+        # converted once up front rather than per chunk, so values that don't fit fail the table before anything's sent
+        records = self.serialize(session.connection(), table_name, df) if first_batch < n_batches else df
+
+        stats = []
+        for batch in range(first_batch, n_batches):
+            chunk = records.iloc[batch * batch_size:(batch + 1) * batch_size]
+            start = time.perf_counter()
+            bytes_before = self.bytes_sent
+            try:
+                conn = session.connection()
+                inserted, inserted_keys = self._load_records(conn, table_name, chunk)
+                if on_batch:
+                    on_batch(conn, table_name, inserted, inserted_keys)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+            seconds = time.perf_counter() - start
+            if checkpoint:
+                checkpoint.record(table_name, batch)
+            if on_commit:
+                on_commit(table_name, chunk, inserted, inserted_keys)
+            stats.append({'batch': batch, 'rows': len(chunk), 'inserted': inserted,
+                          'bytes': self.bytes_sent - bytes_before, 'seconds': seconds})
+            logging.info(f"{table_name} batch {batch + 1} of {n_batches}: sent {len(chunk)} rows, "
+                         f"inserted {inserted}, {seconds:.2f} s")
+
+        return stats
+
+
+class LoadCheckpoint:
+    """
+    Keeps track of the last batch of each table that was committed for a file, in a JSON file, so that when a load
+    fails partway through the next run can skip what already landed. Checkpoints are only reused for the same file
+    contents with the same batch size, since otherwise the batch numbers don't line up (e.g. a new export saved under
+    the old one's name). Tables can be recorded from several threads at once.
+    """
+
+    def __init__(self, path, file_name, batch_size, file_hash):
+        """
+        :param path: path to the JSON checkpoint file (shared between export files)
+        :param file_name: name of the export file being loaded
+        :param batch_size: rows per batch for this load
+        :param file_hash: hash of the export file's contents (see cache.file_hash)
+        """
+        self.path = path
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.file_hash = file_hash
+        self._lock = threading.Lock()
+
+        entry = self._read().get(file_name, {})
+        if entry.get('batch_size') == batch_size and entry.get('file_hash') == file_hash:
+            self._tables = entry.get('tables', {})
+        else:
+            self._tables = {}
+
+    def _read(self):
+        if os.path.isfile(self.path):
+            with open(self.path) as open_file:
+                return json.load(open_file)
+        return {}
+
+    def _write(self, data):
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as open_file:
+            json.dump(data, open_file, indent=2)
+        os.replace(temp_path, self.path)
+
+    def last_batch(self, table_name):
+        """
+        :return: the number of the last committed batch of the table, or -1 if none have been
+        """
+        return self._tables.get(table_name, -1)
+
+    def record(self, table_name, batch):
+        with self._lock:
+            self._tables[table_name] = batch
+            data = self._read()
+            data[self.file_name] = {'batch_size': self.batch_size, 'file_hash': self.file_hash,
+                                    'tables': dict(self._tables)}
+            self._write(data)
+
+    def clear(self):
+        """
+        drops the checkpoint for this file, once it's fully loaded
+        """
+        with self._lock:
+            self._tables = {}
+            data = self._read()
+            if self.file_name in data:
+                del data[self.file_name]
+                self._write(data)
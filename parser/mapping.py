@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+import pandas as pd
+
+EXTRA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'extra')
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class MappingRegistry:
+    """
+    The TableMap and FieldMap, read and cleaned up once and kept as plain dicts:
+
+        table_map:  {FFI table name: database table name}
+        field_maps: {database table name: {FFI column name: database column name}}
+
+    Nothing in here changes after it's built, so it can be shared between threads, and it pickles cleanly for worker
+    processes.
+    """
+
+    def __init__(self, table_map, field_maps):
+        self.table_map = table_map
+        self.field_maps = field_maps
+
+    @classmethod
+    def from_csv(cls, table_map_path=None, field_map_path=None):
+        """
+        Reads and validates the two CSVs (extra/TableMap.csv and extra/FieldMap.csv by default).
+
+        :raises ValueError: if either map is missing columns or maps the same thing two different ways
+        """
+        table_df = pd.read_csv(table_map_path or os.path.join(EXTRA_PATH, 'TableMap.csv'), dtype=str)
+        field_df = pd.read_csv(field_map_path or os.path.join(EXTRA_PATH, 'FieldMap.csv'), dtype=str)
+
+        for df, name, cols in [(table_df, 'TableMap', ['FFITable', 'NewTable']),
+                               (field_df, 'FieldMap', ['TableName', 'ColumnName', 'OldColumn'])]:
+            missing = [col for col in cols if col not in df.columns]
+            if missing:
+                raise ValueError(f"{name} is missing columns: {', '.join(missing)}")
+            for col in cols:
+                df[col] = df[col].str.strip().replace('', None)
+
+        problems = []
+
+        dup_tables = table_df.loc[table_df.duplicated('FFITable', keep=False), 'FFITable'].unique()
+        if len(dup_tables) > 0:
+            problems.append(f"FFI tables mapped more than once in TableMap: {', '.join(dup_tables)}")
+
+        dup_cols = field_df.loc[field_df.duplicated(['TableName', 'ColumnName'], keep=False)]
+        for table, col in dup_cols[['TableName', 'ColumnName']].drop_duplicates().itertuples(index=False):
+            problems.append(f"{table}.{col} is listed more than once in FieldMap")
+
+        # a lot of database columns don't have an FFI column; those are just left out
+        mapped = field_df.dropna(subset=['OldColumn'])
+        dup_old = mapped.loc[mapped.duplicated(['TableName', 'OldColumn'], keep=False)]
+        for table, col in dup_old[['TableName', 'OldColumn']].drop_duplicates().itertuples(index=False):
+            problems.append(f"{col} is mapped to more than one column of {table} in FieldMap")
+
+        if problems:
+            raise ValueError('Problems with the table/field maps:\n' + '\n'.join(problems))
+
+        table_map = dict(zip(table_df['FFITable'], table_df['NewTable']))
+        field_maps = {table: dict(zip(group['OldColumn'], group['ColumnName']))
+                      for table, group in mapped.groupby('TableName', sort=False)}
+
+        unmapped = sorted(set(table_map.values()) - set(field_maps))
+        if unmapped:
+            logging.warning(f"Tables in TableMap with no FieldMap columns: {', '.join(unmapped)}")
+
+        return cls(table_map, field_maps)
+
+    def target_table(self, ffi_table):
+        """
+        :return: the database table an FFI table loads into, or None if it doesn't get loaded
+        """
+        return self.table_map.get(ffi_table)
+
+    def field_map(self, table_name):
+        """
+        :param table_name: database table name
+        :return: dict of {FFI column name: database column name}, in FieldMap order
+        """
+        return self.field_maps.get(table_name, {})
+
+
+def get_registry():
+    """
+    The process-wide MappingRegistry, read from the CSVs the first time it's asked for
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MappingRegistry.from_csv()
+    return _registry
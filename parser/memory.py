@@ -0,0 +1,58 @@
+from pandas import DataFrame, Series, Categorical, StringDtype, factorize
+from pandas.api.types import is_object_dtype
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = StringDtype('pyarrow')
+except ImportError:  # without pyarrow, high-cardinality strings just stay as Python objects
+    STRING_DTYPE = None
+
+
+def compact_frame(df, max_ratio=0.5, min_rows=10000):
+    """
+    Shrinks a table's string columns. Columns where values repeat a lot (method names, unit systems, field names, row
+    IDs, most attribute values) become categoricals, so each distinct string is only stored once. The rest (mostly
+    GUIDs) become pyarrow-backed strings when pyarrow is installed, but only if they have no nulls, so NaN keeps
+    behaving like it always has in the transforms ('nan' from astype(str), False from comparisons, etc.).
+
+    Small tables are left alone; they aren't where the memory goes, and they're the ones that get the most string
+    handling in the transforms.
+
+    :param df: DataFrame to compact. It isn't changed.
+    :param max_ratio: most distinct values per row for a column to become a categorical
+    :param min_rows: tables with fewer rows than this aren't compacted
+    :return: compacted DataFrame
+    """
+    if len(df) < min_rows:
+        return df
+
+    converted = {}
+    for col in df.columns:
+        values = df[col]
+        if not is_object_dtype(values.dtype):
+            continue
+        # sorted categories, same as astype('category'), so sorting and pivoting order the labels as strings
+        codes, uniques = factorize(values, sort=True)
+        if len(uniques) <= max_ratio * len(values):
+            converted[col] = Series(Categorical.from_codes(codes, categories=uniques), index=df.index, name=col)
+        elif STRING_DTYPE is not None and not values.hasnans:
+            converted[col] = values.astype(STRING_DTYPE)
+
+    return df.assign(**converted) if converted else df
+
+
+def memory_report(data_map):
+    """
+    Memory used by each table, biggest first. String storage is counted too (deep=True), which is what makes the
+    object columns so big.
+
+    :param data_map: dict of {table name: DataFrame}
+    :return: DataFrame with Table, Rows, Columns and MB
+    """
+    report = DataFrame({
+        'Table': list(data_map),
+        'Rows': [len(df) for df in data_map.values()],
+        'Columns': [len(df.columns) for df in data_map.values()],
+        'MB': [df.memory_usage(index=True, deep=True).sum() / 2 ** 20 for df in data_map.values()]
+    })
+    return report.sort_values('MB', ascending=False, kind='stable').reset_index(drop=True)
@@ -0,0 +1,192 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:  # optional; without it peak memory comes from resource (not on Windows) or isn't reported
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """
+    the most memory (resident set size) this process has used so far, in MB, or None if there's no way to tell here
+    """
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        # Windows tracks the peak itself; elsewhere psutil only has the current size
+        peak = getattr(info, 'peak_wset', None)
+        if peak is not None:
+            return peak / 2 ** 20
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 2 ** 10
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    return None
+
+
+class StageMetrics:
+    """
+    Records how long each stage of processing an export takes: wall time, CPU time of the thread running it, the
+    process's peak memory by the end of the stage, rows in and out, and (for loads) roughly how many bytes of SQL and
+    parameters went to the database. Stages can be nested, and stages running on different threads (e.g. tables
+    loading in parallel) are recorded separately.
+    """
+
+    def __init__(self, file_name):
+        """
+        :param file_name: name of the export the stages belong to
+        """
+        self.file_name = file_name
+        self.stages = []
+        self._open = []  # top-level stages that haven't finished, which stages on other threads get nested under
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # FFIFiles get sent back from worker processes, and locks can't be pickled
+        state = self.__dict__.copy()
+        del state['_lock'], state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        """
+        :return: the record of the innermost stage running on this thread, or None. Stages can fill in rows_out and
+            sql_bytes on it as they go.
+        """
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        times the code in the with block as one stage
+
+        :param name: name of the stage
+        :param rows_in: optional number of rows going into the stage
+        :return: the stage's record (a dict), which rows_out and sql_bytes can be set on
+        """
+        stack = self._stack()
+        with self._lock:
+            parent = stack[-1] if stack else (self._open[-1] if self._open else None)
+        record = {'stage': name,
+                  'parent': parent['stage'] if parent else None,
+                  'rows_in': rows_in,
+                  'rows_out': None,
+                  'sql_bytes': None}
+        stack.append(record)
+        if parent is None:
+            with self._lock:
+                self._open.append(record)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall_start, 4)
+            record['cpu_s'] = round(time.thread_time() - cpu_start, 4)
+            peak = peak_rss_mb()
+            record['peak_rss_mb'] = round(peak, 1) if peak is not None else None
+            stack.pop()
+            with self._lock:
+                if parent is None:
+                    self._open.remove(record)
+                self.stages.append(record)
+
+    def to_dict(self):
+        """
+        :return: the report as a JSON-friendly dict
+        """
+        with self._lock:
+            stages = list(self.stages)
+        return {'file': self.file_name, 'stages': stages}
+
+    def write(self, directory):
+        """
+        writes the report to <directory>/<file name>.json
+
+        :return: path of the report
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.file_name}.json')
+        with open(path, 'w') as open_file:
+            json.dump(self.to_dict(), open_file, indent=2)
+        return path
+
+    def summary(self):
+        """
+        :return: one line per top-level stage, for the log
+        """
+        lines = []
+        for record in self.to_dict()['stages']:
+            if record['parent'] is None:
+                lines.append(f"{record['stage']}: {record['wall_s']:.2f} s wall, {record['cpu_s']:.2f} s CPU, "
+                             f"rows in {record['rows_in']}, rows out {record['rows_out']}")
+        return '\n'.join(lines)
+
+
+def timed(name=None, rows_in=None, rows_out=None):
+    """
+    Decorator that records an FFIFile method as a stage in its StageMetrics (self.metrics).
+
+    :param name: stage name, or a function of the method's arguments that returns one. The method name by default.
+    :param rows_in: optional function of the method's arguments (self included) giving the rows going in
+    :param rows_out: optional function of the method's arguments giving the rows coming out, called after it runs
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stage_name = name(self, *args, **kwargs) if callable(name) else (name or method.__name__)
+            with self.metrics.stage(stage_name) as record:
+                if rows_in is not None:
+                    record['rows_in'] = rows_in(self, *args, **kwargs)
+                result = method(self, *args, **kwargs)
+                if rows_out is not None:
+                    record['rows_out'] = rows_out(self, *args, **kwargs)
+            return result
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def profiled(path):
+    """
+    Runs the with block under cProfile and dumps the stats to path (open with pstats or snakeviz). Only the thread
+    that enters the block is profiled.
+
+    :param path: where to write the .prof file, or None to not profile
+    """
+    if path is None:
+        yield
+        return
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,173 @@
+import numpy as np
+from pandas import DataFrame, Index, Series, CategoricalDtype, factorize, concat
+from pandas.api.types import is_object_dtype, is_string_dtype
+
+
+def _is_text(dtype):
+    """
+    True for plain object columns, pyarrow/pandas strings, and categoricals of strings (see memory.compact_frame)
+    """
+    if isinstance(dtype, CategoricalDtype):
+        dtype = dtype.categories.dtype
+    return is_object_dtype(dtype) or is_string_dtype(dtype)
+
+
+def _factorize(column):
+    """
+    :return: (codes, uniques) for a column, with -1 as the code for nulls. Sorted codes order the same way pandas sorts
+    labels when pivoting (nulls first), so the wide tables come out in the same order as DataFrame.pivot. Uniques of
+    categorical or pyarrow columns come back as plain objects, so the wide tables look the same either way.
+    """
+    codes, uniques = factorize(column, sort=True)
+    if isinstance(uniques.dtype, CategoricalDtype):
+        uniques = Index(np.asarray(uniques), dtype=uniques.dtype.categories.dtype)
+    if not is_object_dtype(uniques.dtype) and is_string_dtype(uniques.dtype):
+        uniques = Index(np.asarray(uniques, dtype=object), dtype=object)
+    return codes, uniques
+
+
+def _labels(uniques, codes):
+    """
+    turns codes back into labels, with nulls for the -1 codes
+
+    :param uniques: labels the codes point to
+    :param codes: array of codes
+    :return: array-like of labels
+    """
+    if len(uniques) == 0:  # nothing but nulls
+        return Index(np.full(len(codes), np.nan)).astype(uniques.dtype)
+    return uniques.take(codes, allow_fill=True, fill_value=np.nan)
+
+
+def _dense(codes, n_codes):
+    """
+    renumbers the codes that show up in `codes` as 0..k-1, keeping their order. -1 (null) codes stay the lowest.
+
+    :return: (new codes, the old code for each new code)
+    """
+    present = np.bincount(codes + 1, minlength=n_codes + 1) > 0
+    return (np.cumsum(present) - 1)[codes + 1], np.flatnonzero(present) - 1
+
+
+class _Pivoter:
+    """
+    Codes for a whole long table, worked out once so each group can be pivoted on integers.
+    """
+
+    def __init__(self, long_df, index, columns, values):
+        self.long_df = long_df
+        self.index = list(index)
+        self.columns = columns
+
+        # sorted codes order the same way pandas sorts labels when pivoting (nulls first), so the wide tables come out
+        # in the same order as DataFrame.pivot
+        self.index_codes = {}
+        self.index_uniques = {}
+        for col in self.index:
+            self.index_codes[col], self.index_uniques[col] = _factorize(long_df[col])
+        self.row_codes = DataFrame(self.index_codes).groupby(self.index, sort=True).ngroup().to_numpy()
+        self.n_row_codes = self.row_codes.max() + 1 if len(self.row_codes) else 0
+
+        self.field_codes, self.field_uniques = _factorize(long_df[columns])
+        self.values = long_df[values].to_numpy(dtype=object)
+
+    def drop_duplicates(self, positions):
+        """
+        drops rows that are exact duplicates of an earlier row. Duplicates have to land in the same cell, so only the
+        rows that share a cell get compared across every column.
+
+        :param positions: positions of the group's rows in the long table
+        :return: positions of the rows to keep
+        """
+        n_fields = len(self.field_uniques) + 1
+        cells = self.row_codes[positions].astype(np.int64) * n_fields + self.field_codes[positions]
+        shared = np.flatnonzero(Series(cells).duplicated(keep=False).to_numpy())
+        if len(shared) == 0:
+            return positions
+
+        keep = np.ones(len(positions), dtype=bool)
+        keep[shared[self.long_df.iloc[positions[shared]].duplicated().to_numpy()]] = False
+        return positions[keep]
+
+    def pivot(self, positions):
+        """
+        pivots the rows at `positions` of the long table. Gives the same table as
+        long_df.iloc[positions].pivot(index=index, columns=[columns], values=values).reset_index()
+
+        :param positions: positions of the group's rows in the long table
+        :return: wide DataFrame
+        """
+        row_ids, row_codes = _dense(self.row_codes[positions], self.n_row_codes)
+        col_ids, field_codes = _dense(self.field_codes[positions], len(self.field_uniques))
+        n_rows, n_cols = len(row_codes), len(field_codes)
+
+        cells = row_ids.astype(np.int64) * n_cols + col_ids
+        if np.bincount(cells, minlength=n_rows * n_cols).max(initial=0) > 1:
+            raise ValueError("Index contains duplicate entries, cannot reshape")
+
+        grid = np.full((n_rows, n_cols), np.nan, dtype=object)
+        grid[row_ids, col_ids] = self.values[positions]
+
+        # a row from the long table for each wide row, to look up its index labels
+        first = np.empty(n_rows, dtype=np.intp)
+        first[row_ids] = positions
+
+        wide = concat([
+            DataFrame({
+                col: _labels(self.index_uniques[col], self.index_codes[col][first])
+                for col in self.index
+            }),
+            DataFrame(grid, columns=_labels(self.field_uniques, field_codes))
+        ], axis=1)
+        wide.columns = Index(wide.columns, name=self.columns)
+        return wide
+
+
+def pivot_by_group(long_df, by, index, columns, values, drop_duplicates=False):
+    """
+    Pivots a long table (like AttributeData joined to its methods) into one wide table per value of `by`. The columns
+    the pivot needs are factorized once for the whole table and the groups are found with one sort, so each group is
+    pivoted on integer codes, instead of masking the whole table for every method and pivoting the subsets.
+
+    Groups come out in the order they first show up in the long table, same as .unique(), and each table matches what
+    DataFrame.pivot(...).reset_index() gives for that group. Rows where `by` is null are skipped.
+
+    :param long_df: long DataFrame to pivot
+    :param by: column to split the tables on (e.g. 'Method_Name')
+    :param index: list of columns identifying a row in the wide tables
+    :param columns: column holding the wide tables' column names
+    :param values: column holding the values
+    :param drop_duplicates: drop duplicate rows within each group before pivoting
+    :return: generator of (group value, wide DataFrame) pairs
+    """
+    # non-string values would need their own dtype handling, so leave those to pandas
+    if not _is_text(long_df[values].dtype):
+        for key, group in long_df.groupby(by, sort=False):
+            if drop_duplicates:
+                group = group.drop_duplicates()
+            yield key, group.pivot(index=index, columns=[columns], values=values).reset_index()
+        return
+
+    pivoter = _Pivoter(long_df, index, columns, values)
+    group_codes, group_uniques = factorize(long_df[by], sort=False)
+
+    # one stable sort puts each group's rows together, still in their original order
+    order = np.argsort(group_codes, kind='stable')
+    bounds = np.searchsorted(group_codes[order], np.arange(len(group_uniques) + 1))
+    for group, key in enumerate(group_uniques):
+        positions = order[bounds[group]:bounds[group + 1]]
+        if drop_duplicates:
+            positions = pivoter.drop_duplicates(positions)
+        yield key, pivoter.pivot(positions)
+
+
+def split_by(df, by):
+    """
+    Splits a table on the values of one column in a single pass, rather than masking it once per value.
+
+    :param df: DataFrame to split
+    :param by: column to split on
+    :return: generator of (value, subset DataFrame) pairs, in the order the values first show up
+    """
+    for key, group in df.groupby(by, sort=False):
+        yield key, group
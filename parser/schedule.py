@@ -0,0 +1,74 @@
+import logging
+from parser.mapping import get_registry
+
+
+class LoadPlan:
+    """
+    The order to load an FFIFile's tables into the database in. Tables are grouped into levels from the foreign key
+    graph: every table only references tables in earlier levels, so loading level by level inserts each table exactly
+    once with its parent tables already in place. Tables within a level don't depend on each other.
+    """
+
+    def __init__(self, levels, table_names):
+        """
+        :param levels: list of lists of FFI table names
+        :param table_names: dict of {FFI table name: database table name}
+        """
+        self.levels = levels
+        self.table_names = table_names
+
+    def __iter__(self):
+        for level in self.levels:
+            yield from level
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+    def __str__(self):
+        lines = []
+        for idx, level in enumerate(self.levels):
+            tables = ', '.join(f'{table} -> {self.table_names[table]}' for table in level)
+            lines.append(f'  {idx + 1}: {tables}')
+        return 'Load plan:\n' + '\n'.join(lines)
+
+    @classmethod
+    def build(cls, tables, ffi_db, table_map=None):
+        """
+        Builds the plan for a set of FFI tables. Tables that aren't in the TableMap don't get loaded, so they're left out.
+
+        :param tables: FFI table names to load, in their default order
+        :param ffi_db: FFIDatabase object, for the foreign key graph
+        :param table_map: optional dict of {FFI table name: database table name}; the TableMap from the mapping
+            registry if not given
+        :return: LoadPlan
+        """
+        if table_map is None:
+            table_map = get_registry().table_map
+
+        table_names = {table: table_map[table] for table in tables if table in table_map}
+        ffi_tables = {}  # database table -> FFI tables that load into it
+        for table, db_table in table_names.items():
+            ffi_tables.setdefault(db_table, []).append(table)
+
+        db_deps = ffi_db.get_dependencies()
+        deps = {table: set(parent
+                           for ref_table in db_deps.get(db_table, set())
+                           for parent in ffi_tables.get(ref_table, [])
+                           if parent != table)
+                for table, db_table in table_names.items()}
+
+        # Kahn's algorithm, one level at a time
+        levels = []
+        remaining = list(table_names)
+        done = set()
+        while remaining:
+            level = [table for table in remaining if deps[table] <= done]
+            if not level:
+                # a cycle in the foreign keys; load the rest in their default order and let the database sort it out
+                logging.warning(f"Circular foreign keys between {', '.join(remaining)}")
+                level = remaining
+            levels.append(level)
+            done.update(level)
+            remaining = [table for table in remaining if table not in done]
+
+        return cls(levels, table_names)
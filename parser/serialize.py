@@ -0,0 +1,170 @@
+from datetime import datetime
+from uuid import UUID
+import numpy as np
+import pandas as pd
+from sqlalchemy import types
+
+_TRUE = {'true', 't', 'yes', 'y', '1', '-1'}
+_FALSE = {'false', 'f', 'no', 'n', '0'}
+_UTC_OFFSET = r'(?:Z|[+-]\d{2}:?\d{2})$'
+
+
+def _blank(values):
+    """
+    True for values that are just whitespace or 'nan' (how missing numbers come out of astype(str)), which get sent as
+    NULL like real nulls do
+    """
+    return values.astype(str).str.strip().str.lower().isin(['', 'nan']).to_numpy()
+
+
+def _to_objects(native, ok):
+    """
+    :param native: array of converted values
+    :param ok: boolean array, False where the value is null or couldn't be converted
+    :return: object array of Python values, with None for the rest
+    """
+    out = np.full(len(ok), None, dtype=object)
+    if ok.any():
+        out[ok] = np.asarray(native)[ok].tolist()
+    return out
+
+
+def _integers(values):
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64')
+    ok = np.isfinite(numbers) & (numbers == np.round(numbers)) & (np.abs(numbers) < 2 ** 63)
+    return _to_objects(np.where(ok, numbers, 0).astype('int64'), ok)
+
+
+def _numbers(values):
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64')
+    return _to_objects(numbers, np.isfinite(numbers))
+
+
+def _booleans(values):
+    text = values.astype(str).str.strip().str.lower()
+    is_true = text.isin(_TRUE).to_numpy()
+    ok = is_true | text.isin(_FALSE).to_numpy()
+    return _to_objects(is_true, ok & values.notna().to_numpy())
+
+
+def _iso_datetime(value):
+    """
+    :return: the value parsed as an ISO 8601 datetime, or None if it isn't one
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _datetimes(values, date_only=False):
+    # UTC offsets are dropped, keeping the wall time, which is what the server does when it casts a string with one to
+    # DATETIME2. pandas would otherwise give every value in the column the first value's offset.
+    text = values.astype(str).str.strip().str.replace(_UTC_OFFSET, '', regex=True)
+    parsed = pd.to_datetime(text, format='ISO8601', errors='coerce')
+    ok = parsed.notna().to_numpy()
+    native = _to_objects(pd.DatetimeIndex(parsed).to_pydatetime(), ok)
+
+    # datetime64 only holds years 1677-2262, so dates like the 0001-01-01 FFI uses for "no date" come out as NaT.
+    # Those get parsed one by one into Python datetimes, which hold any year.
+    missed = ~ok & values.notna().to_numpy()
+    if missed.any():
+        native[missed] = text[missed].map(_iso_datetime).to_numpy(dtype=object)
+    if date_only:
+        native = np.array([None if value is None else value.date() for value in native], dtype=object)
+    return native
+
+
+def _guids(values, native_uuid):
+    out = np.full(len(values), None, dtype=object)
+    for position, value in enumerate(values.to_numpy(dtype=object)):
+        if value is None or value != value:
+            continue
+        try:
+            guid = UUID(str(value).strip())
+        except ValueError:
+            continue
+        out[position] = guid if native_uuid else str(guid).upper()
+    return out
+
+
+def _strings(values, length):
+    text = values.astype(object) if values.dtype == object else values.astype(str).where(values.notna())
+    out = text.to_numpy(dtype=object, copy=True)
+    out[text.isna().to_numpy()] = None
+    too_long = (text.str.len() > length).to_numpy() if length else np.zeros(len(out), dtype=bool)
+    return out, too_long
+
+
+def column_values(values, sql_type, native_uuid=False):
+    """
+    Converts a column of (mostly string) values to Python values of the database column's type in one pass, so they
+    go over as numbers, datetimes, bits and GUIDs instead of text the server has to cast.
+
+    :param values: Series of values for one column
+    :param sql_type: the column's SQLAlchemy type (from FFIDatabase.tables)
+    :param native_uuid: send GUIDs as uuid.UUID (for drivers that bind them natively, like pyodbc) rather than strings
+    :return: tuple of (object array of Python values with None for nulls, boolean array that's True for values that
+        don't fit the type, i.e. aren't blank but didn't convert, or are longer than the column)
+    """
+    if isinstance(sql_type, types.String):
+        return _strings(values, getattr(sql_type, 'length', None))
+
+    if isinstance(sql_type, types.Boolean):
+        native = _booleans(values)
+    elif isinstance(sql_type, types.Integer):
+        native = _integers(values)
+    elif isinstance(sql_type, types.Numeric):
+        native = _numbers(values)
+    elif isinstance(sql_type, types.DateTime):
+        native = _datetimes(values)
+    elif isinstance(sql_type, types.Date):
+        native = _datetimes(values, date_only=True)
+    elif isinstance(sql_type, types.Uuid):
+        native = _guids(values, native_uuid)
+    else:
+        # anything else (money, binary, etc.) goes as it is, with nulls as None
+        return values.astype(object).where(values.notna(), None).to_numpy(dtype=object), np.zeros(len(values), bool)
+
+    # only values that didn't convert need checking for whether they were blank to begin with
+    bad = pd.isna(native) & values.notna().to_numpy()
+    if bad.any():
+        bad[bad] = ~_blank(values[bad])
+    return native, bad
+
+
+def serialize_frame(df, table, native_uuid=False):
+    """
+    Converts each column of a table being loaded to its database column's type (see column_values). Blank values go
+    as NULL, but values that don't fit (e.g. text in a numeric column, or strings longer than the column) raise an
+    error instead of being sent as NULL or cut short, so the table fails and the file gets tried again once the data's
+    fixed. Columns the table doesn't have are left as they are.
+
+    :param df: DataFrame whose columns are named after the columns of the database table
+    :param table: the SQLAlchemy Table being loaded into
+    :param native_uuid: send GUIDs as uuid.UUID rather than strings
+    :return: DataFrame of object columns holding Python values, with None for nulls
+    :raises ValueError: listing every column with values that don't fit, with a few examples of each
+    """
+    converted = {}
+    problems = []
+    for col in df.columns:
+        if col not in table.columns:
+            converted[col] = df[col].astype(object).where(df[col].notna(), None).to_numpy(dtype=object)
+            continue
+
+        sql_type = table.columns[col].type
+        converted[col], bad = column_values(df[col], sql_type, native_uuid)
+        if bad.any():
+            examples = ', '.join(repr(value) for value in df[col][bad].unique()[:3])
+            if isinstance(sql_type, types.String):
+                problems.append(f"{bad.sum()} values in {col} are longer than {sql_type.length} characters "
+                                f"(e.g. {examples})")
+            else:
+                problems.append(f"{bad.sum()} values in {col} aren't a valid {sql_type} (e.g. {examples})")
+
+    if problems:
+        raise ValueError(f"Data for {table.name} doesn't fit its columns: {'; '.join(problems)}")
+
+    # object dtype, or pandas turns the datetimes back into Timestamps and the Nones into NaT
+    return pd.DataFrame(converted, index=df.index, columns=df.columns, dtype=object)
@@ -1,21 +1,165 @@
+import logging
+import os
+import pickle
+import time
+from hashlib import sha256
 import pandas as pd
-from sqlalchemy import MetaData
+import sqlalchemy
+from sqlalchemy import MetaData, create_engine, inspect, text
 from sqlalchemy.orm import Session
 
 
+class SchemaCache:
+    """
+    Keeps the reflected schema (tables, column types, primary and foreign keys) in a pickle file, so the database
+    doesn't have to be reflected table by table every run. Each entry is checked against a cheap fingerprint of the
+    schema first, one query that changes whenever a table or constraint does:
+
+        SQL Server: the number of user objects and their latest modify_date (sys.objects)
+        SQLite:     PRAGMA schema_version
+        others:     a hash of information_schema.columns
+
+    If the fingerprint can't be read, the schema is just reflected like before.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: where to keep the cached schemas (one file per database and set of tables)
+        """
+        self.directory = directory
+
+    def _path(self, engine, only):
+        # one entry per database (going by its URL, without the password) and set of tables reflected
+        key = '|'.join([engine.url.render_as_string(hide_password=True), ','.join(sorted(only or []))])
+        return os.path.join(self.directory, f'schema_{sha256(key.encode()).hexdigest()[:16]}.pickle')
+
+    @staticmethod
+    def fingerprint(engine):
+        """
+        :return: string that changes whenever the database schema does, or None if there's no cheap way to tell
+        """
+        if engine.dialect.name == 'mssql':
+            sql = "SELECT COUNT(*), MAX(modify_date) FROM sys.objects WHERE is_ms_shipped = 0"
+        elif engine.dialect.name == 'sqlite':
+            sql = "PRAGMA main.schema_version"
+        else:
+            sql = """
+            SELECT table_name, column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema()
+            ORDER BY table_name, ordinal_position
+            """
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(text(sql)).fetchall()
+        except Exception:
+            logging.exception("Couldn't read the schema fingerprint; reflecting the whole schema")
+            return None
+        return sha256(repr([tuple(row) for row in rows]).encode()).hexdigest()
+
+    def load(self, engine, only=None):
+        """
+        :return: the cached MetaData, or None if there isn't one or the schema has changed since it was cached
+        """
+        path = self._path(engine, only)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as open_file:
+                entry = pickle.load(open_file)
+        except Exception:
+            logging.warning(f"Couldn't read the cached schema at {path}; reflecting again")
+            return None
+
+        if entry.get('sqlalchemy') != sqlalchemy.__version__:
+            return None
+        fingerprint = self.fingerprint(engine)
+        if fingerprint is None or entry.get('fingerprint') != fingerprint:
+            logging.info("Database schema changed since it was cached; reflecting again")
+            return None
+        return entry['meta']
+
+    def store(self, engine, meta, only=None):
+        """
+        saves the reflected MetaData along with the schema's fingerprint
+        """
+        fingerprint = self.fingerprint(engine)
+        if fingerprint is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(engine, only)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as open_file:
+            pickle.dump({'sqlalchemy': sqlalchemy.__version__, 'fingerprint': fingerprint, 'meta': meta}, open_file)
+        os.replace(temp_path, path)
+
+
 class FFIDatabase:
     """
     this represents everything you will need from an FFI database. Contains some SQLAlchemy bits, as well as all primary
     and foreign keys
     """
 
-    def __init__(self, engine):
+    def __init__(self, engine, schema_cache=None, only=None):
+        """
+        :param engine: SQLAlchemy Engine for the database
+        :param schema_cache: optional SchemaCache, so the schema only gets reflected when it has changed
+        :param only: optional list of table names to reflect (e.g. the tables in TableMap) instead of the whole
+            database. Tables they reference get reflected too. Names that aren't in the database are skipped.
+        """
         self.engine = engine
-        self.meta = MetaData()
-        self.meta.reflect(self.engine)
+        self.meta = self._reflect(schema_cache, only)
         self.tables = self.meta.tables
         self._primary_keys = None
         self._foreign_keys = None
+        self._dependencies = None
+
+    def _reflect(self, schema_cache, only):
+        """
+        :return: MetaData for the database, from the schema cache if it's up to date
+        """
+        start = time.perf_counter()
+        meta = schema_cache.load(self.engine, only) if schema_cache else None
+        if meta is not None:
+            logging.info(f"Loaded the cached schema ({len(meta.tables)} tables) in {time.perf_counter() - start:.2f} s")
+            return meta
+
+        meta = MetaData()
+        if only is not None:
+            existing = set(inspect(self.engine).get_table_names())
+            missing = sorted(set(only) - existing)
+            if missing:
+                logging.warning(f"Tables not in the database: {', '.join(missing)}")
+            meta.reflect(self.engine, only=sorted(set(only) & existing))
+        else:
+            meta.reflect(self.engine)
+        logging.info(f"Reflected {len(meta.tables)} tables in {time.perf_counter() - start:.2f} s")
+
+        if schema_cache:
+            schema_cache.store(self.engine, meta, only)
+        return meta
+
+    @classmethod
+    def from_url(cls, url, pool_size=5, schema_cache=None, only=None, **engine_kwargs):
+        """
+        Creates the engine along with the FFIDatabase. The connection pool is sized for pool_size connections at once
+        (e.g. one per table being loaded in parallel), with no overflow past that.
+
+        :param url: SQLAlchemy URL for the database
+        :param pool_size: number of connections in the pool
+        :param schema_cache: optional SchemaCache (see __init__)
+        :param only: optional list of table names to reflect (see __init__)
+        :param engine_kwargs: anything else to pass to create_engine
+        """
+        engine = create_engine(url, pool_size=pool_size, max_overflow=0, **engine_kwargs)
+        return cls(engine, schema_cache=schema_cache, only=only)
+
+    @property
+    def pool_size(self):
+        """
+        the number of connections the engine's pool holds, i.e. how many tables can be loaded at the same time
+        """
+        size = getattr(self.engine.pool, 'size', None)
+        return size() if callable(size) else 1
 
     def get_primary_keys(self):
         if not self._primary_keys:
@@ -37,6 +181,22 @@ class FFIDatabase:
 
         return self._foreign_keys
 
+    def get_dependencies(self):
+        """
+        The foreign key graph of the database, as {table: set of tables it references}. Self-references are left out,
+        since they don't affect the order tables get loaded in.
+        """
+        if not self._dependencies:
+            fks = self.get_foreign_keys()
+            deps = {table: set(ref_table
+                               for column in fks[table]
+                               for ref_table, _ in fks[table][column]
+                               if ref_table != table)
+                    for table in fks}
+            self._dependencies = deps
+
+        return self._dependencies
+
     def start_session(self):
         """
         Starts a session for executing SQL statements
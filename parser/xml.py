@@ -1,16 +1,31 @@
 import os
-import re
 from uuid import uuid4
-from pandas import DataFrame, concat, options
+from pandas import DataFrame, options
 from re import findall
-from parser.functions import strip_namespace, convert_datetime
+from parser.functions import strip_namespace, convert_datetime_series, split_name_lists, join_name_lists, \
+    normalize_id_part, plot_id_prefix
+from parser.builder import TableBuilder
+from parser.pivot import pivot_by_group, split_by
+from parser.joins import JoinChain
+from parser.metrics import StageMetrics, timed
+from parser.memory import compact_frame, memory_report
+from parser.loader import BulkLoader, LoadCheckpoint
+from parser.cache import file_hash
+from parser.schedule import LoadPlan
+from parser.mapping import get_registry
+from parser.fingerprint import FingerprintStore
+from parser.keys import typed_keys
 import xml.etree.ElementTree as ET
+from sqlalchemy import inspect as sa_inspect
 import datetime
 # import logging
 import warnings
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 warnings.simplefilter(action='ignore', category=FutureWarning)
 import pandas as pd
+import numpy as np
 
 options.mode.chained_assignment = None
 logging.basicConfig(filename='C:/Users/Corey/OneDrive/OneDrive - New Mexico Highlands University/Python/FFI/XMLToCustom/log/data.log',
@@ -24,9 +39,18 @@ class FFIFile:
     the element names that appear in the XML file.
     """
 
-    def __init__(self, file):
+    def __init__(self, file, streaming=False, fingerprints=None, compact=False):
         """
         parses a ElementTree root element and creates the FFIFile class
+
+        :param file: path to the XML export to read (a string, os.DirEntry or other path-like)
+        :param streaming: if True, the file isn't parsed into an element tree up front. Instead, _parse_data reads it
+            with iterparse in a single pass and throws each element away once it's been read, which keeps memory down
+            on very large exports.
+        :param fingerprints: optional path to a SQLite fingerprint store. If given, only rows that are new or changed
+            since they were last inserted get sent to the database.
+        :param compact: if True, the big extracted tables get categorical/pyarrow string columns instead of Python
+            object strings (see memory.compact_frame), which cuts memory a lot on large exports.
         """
         # with open(file) as open_file:
         #     f_gen = (open_file.readline() for i in range(50000))
@@ -35,10 +59,18 @@ class FFIFile:
         #     file_id = file_hash.hexdigest()
 
         # self._id = file_id
-        self.file = file.name.strip('.xml')
-        self._tree = ET.parse(file)
-        self._root = self._tree.getroot()
-        self._namespace = findall(r'\{http://\w+\.\w{3}[\w/.\d]+\}', self._root.tag)[0].strip('{}')
+        self._source = os.fspath(file)
+        self.file = os.path.basename(self._source).strip('.xml')
+        self._streaming = streaming
+        if streaming:
+            # the namespace gets picked up off the root element once we start reading the file
+            self._tree = None
+            self._root = None
+            self._namespace = None
+        else:
+            self._tree = ET.parse(file)
+            self._root = self._tree.getroot()
+            self._namespace = findall(r'\{http://\w+\.\w{3}[\w/.\d]+\}', self._root.tag)[0].strip('{}')
         self._base_tables = {}
         self._data_map = {}
         self._excluded = ['FuelConstants_DL', 'FuelConstants_ExpDL', 'FuelConstants_FWD', 'FuelConstants_Veg',
@@ -56,6 +88,14 @@ class FFIFile:
         self.version = None
         self.admin_unit = None
         self.insert_failed = []
+        self.unknown_species = []
+        self._batch_size = None
+        self._checkpoint = None
+        self._key_cache = None
+        self._fingerprints = FingerprintStore(fingerprints) if fingerprints else None
+        self._species_index = None
+        self._compact = compact
+        self.metrics = StageMetrics(self.file)
         # current = datetime.datetime.now()
         # self.log_file = f"Migration_Log_{current.year}{current.month}{current.day}{current.hour}{current.minute}{current.second}.log"
         # self._parse_idents()
@@ -98,31 +138,98 @@ class FFIFile:
         # overwrite last modified
         last_modified.to_sql('Last_Modified_Date', session.bind, index=False, if_exists='replace')
 
+    @staticmethod
+    def _read_record(elem, tag_names):
+        """
+        Reads a record element into a (table name, {field: value}) tuple. tag_names caches the namespace-stripped tag
+        names, since strip_namespace is a regex and the same tags repeat constantly.
+        """
+        record = {}
+        for attr in elem:
+            if attr.tag not in tag_names:
+                tag_names[attr.tag] = strip_namespace(attr.tag)
+            record[tag_names[attr.tag]] = attr.text
+
+        if elem.tag not in tag_names:
+            tag_names[elem.tag] = strip_namespace(elem.tag)
+        return tag_names[elem.tag], record
+
+    def _iter_records(self):
+        """
+        Streams through the XML file with iterparse and yields a (table name, {field: value}) tuple for every record.
+        Each record is cleared off the root once it has been read, so the full tree never builds up in memory.
+        """
+        tag_names = {}
+        depth = 0
+        root = None
+
+        for event, elem in ET.iterparse(self._source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                    self._namespace = findall(r'\{http://\w+\.\w{3}[\w/.\d]+\}', root.tag)[0].strip('{}')
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1:  # a record (i.e. a row) just finished, which means all of its fields have been read
+                yield self._read_record(elem, tag_names)
+                root.clear()
+
+    def _iter_tree_records(self):
+        """
+        Same as _iter_records, but walks the element tree that was parsed in __init__
+        """
+        tag_names = {}
+        for elem in self._root:
+            yield self._read_record(elem, tag_names)
+
+    @staticmethod
+    def _build_tables(records):
+        """
+        Builds per-table columnar buffers in a single pass over the records, then makes one DataFrame for each table.
+
+        :param records: iterable of (table name, {field: value}) tuples
+        :return: dict of {table name: DataFrame}
+        """
+        builders = {}
+        for table, record in records:
+            if table not in builders:
+                builders[table] = TableBuilder()
+            builders[table].add_row(record)
+
+        return {table: builder.to_frame() for table, builder in builders.items()}
+
+    @timed(rows_out=lambda self: self._total_rows())
     def _parse_data(self):
         """
         Iterates through each element name that was produced in the __init__ operation. This is what actually populates
-        the data_map element
+        the data_map element. In streaming mode, the file is read here in one pass instead.
         """
         # needed_tables = ['MacroPlot', 'RegistrationUnit', 'MM_ProjectUnit_MacroPlot', 'ProjectUnit', 'SampleEvent',
         #                  'MM_MonitoringStatus_SampleEvent', 'MonitoringStatus', 'MethodAttribute', 'AttributeData',
         #                  'Method', 'LU_DataType', 'Schema_Version', 'MasterSpecies', 'SampleData', 'SampleAttribute',
         #                  'LocalSpecies']
 
-        tags = set([strip_namespace(element.tag) for element in self._root])
-        for tag in tags:
-            all_data = self._root.findall(tag, namespaces={'': self._namespace})
-            dfs = [
-                DataFrame({strip_namespace(attr.tag): [attr.text] for attr in data_set})
-                for data_set in all_data
-            ]
-            df = concat(dfs)
-            for col in df.columns:
-                if '_GUID' in col:
-                    df[col] = df[col].apply(lambda row: row.upper())
-                elif 'Date' in col or 'Time' in col:
-                    df[col] = df[col].apply(lambda row: convert_datetime(row))
-            self._data_map[strip_namespace(tag)] = df.reset_index(drop=True)
+        records = self._iter_records() if self._streaming else self._iter_tree_records()
+        tables = self._build_tables(records)
+        for tag, df in tables.items():
+            self._data_map[tag] = self._normalize(df).reset_index(drop=True)
 
+    @staticmethod
+    def _normalize(df):
+        """
+        Upper-cases GUID columns and converts date/time columns to SQL Server-compatible strings, a whole column at a
+        time.
+        """
+        for col in df.columns:
+            if '_GUID' in col:
+                df[col] = df[col].str.upper()
+            elif 'Date' in col or 'Time' in col:
+                df[col] = convert_datetime_series(df[col])
+        return df
+
+    @timed(rows_in=lambda self: len(self['SampleEvent']), rows_out=lambda self: len(self['SampleEvent']))
     def _parse_idents(self):
         """
         This generates PlotID and EventID columns that are used in insertions into the Access database.
@@ -133,67 +240,72 @@ class FFIFile:
 
         This will allow easy lookup when converting from the GUID to the generated ID when methods (and everything else)
         get inserted into the tables, and we need the generated ID for key matching.
-        """
-
-        def create_id(row, id_type):
-            """
-            These functions within functions are annoying, but easier than having it at a higher scope.
-
-            This is just a helper function in generating appropriate IDs for plots and events to match with Access
-
-            For use only within an .apply(), where the row is guaranteed to have the defined columns. Otherwise, this
-            will all break. You can also easily add logic for additional identifiers that need to be created fairly
-            easily by adding additional elif statements to both the create_id function and the outer logic.
-            """
-
-            id_value = ""
-            if id_type == 'plot':
-                admin_guid = row['MacroPlot_RegistrationUnit_GUID']
-                plot_guid = row['MacroPlot_GUID']
-                plot_name = row['MacroPlot_Name']
 
-                admin_unit = self['RegistrationUnit'].loc[
-                    self['RegistrationUnit']['RegistrationUnit_GUID'] == admin_guid
-                ]['RegistrationUnit_Name'].values[0]
-                admin_unit = admin_unit.replace(" ", "").replace("_", "").replace("-", "").replace(".", "").upper()
-                plot_name = plot_name.replace(" ", "").replace("_", "").replace("-", "").replace(".", "").upper()
-                id_value = admin_unit[:5] + plot_name
-
-            elif id_type == 'event':
-                plot_guid = row['SampleEvent_Plot_GUID']
-                try:
-                    plot_id = self['MacroPlot'].loc[
-                        self['MacroPlot']['MacroPlot_GUID'] == plot_guid
-                    ]['PlotID'].values[0]
-                except IndexError:
-                    plot_id = ''
-
-                if plot_id != '':
-                    date_re = re.findall(r'(\d{4}-\d{2}-\d{2})', row['SampleEvent_Date'])
-                    date_raw = date_re[0]
-                    event_date = date_raw.replace('-', '')
-                    id_value = plot_id + event_date
-                else:
-                    id_value = ''
-
-            return id_value
-        # end of function
+        Both IDs are built a whole column at a time, using GUID-indexed lookups into RegistrationUnit and MacroPlot.
+        """
 
         for table in ['MacroPlot', 'SampleEvent']:
             temp_df = self[table]
 
             if table == 'MacroPlot':
-                temp_df['PlotID'] = temp_df.apply(create_id, axis=1, args=('plot',))
+                # PlotID is the first five characters of the admin unit name followed by the plot name. The admin unit
+                # names are looked up through a GUID index rather than scanning RegistrationUnit for every plot.
+                reg_units = self['RegistrationUnit'].drop_duplicates('RegistrationUnit_GUID', keep='first')
+                admin_names = reg_units.set_index('RegistrationUnit_GUID')['RegistrationUnit_Name']
+                admin_prefix = plot_id_prefix(temp_df['MacroPlot_RegistrationUnit_GUID'].map(admin_names))
+                plot_name = normalize_id_part(temp_df['MacroPlot_Name'])
+
+                temp_df['PlotID'] = admin_prefix + plot_name
                 temp_df.dropna(subset='MacroPlot_DateIn', inplace=True)
                 temp_df = temp_df.sort_values('MacroPlot_DateIn').drop_duplicates('PlotID', keep='first')
             elif table == 'SampleEvent':
-                temp_df['EventID'] = temp_df.apply(create_id, axis=1, args=('event',))
+                # EventID is the PlotID followed by the event date (YYYYMMDD). Events on plots we don't have get ''.
+                plots = self['MacroPlot'].drop_duplicates('MacroPlot_GUID', keep='first')
+                plot_ids = plots.set_index('MacroPlot_GUID')['PlotID']
+                plot_id = temp_df['SampleEvent_Plot_GUID'].map(plot_ids)
+                event_date = temp_df['SampleEvent_Date'].str.extract(r'(\d{4}-\d{2}-\d{2})', expand=False) \
+                    .str.replace('-', '')
+
+                temp_df['EventID'] = (plot_id + event_date).where(plot_id.notna(), '')
                 temp_df.dropna(subset='EventID', inplace=True)
                 temp_df = temp_df[temp_df['EventID'] != '']
                 temp_df = temp_df.sort_values('EventID').drop_duplicates('EventID', keep='first')
 
             self[table] = temp_df
 
+    def _species_symbols(self):
+        """
+        GUID -> USDA symbol index for LocalSpecies. This is built once per file the first time it's needed, rather than
+        scanning LocalSpecies for every tree or plant row.
+        """
+        if self._species_index is None:
+            spp_df = self['LocalSpecies'].drop_duplicates('LocalSpecies_GUID', keep='first')
+            # plain objects, so unknown species come out as NaN even if LocalSpecies was compacted
+            self._species_index = spp_df.set_index('LocalSpecies_GUID')['LocalSpecies_Symbol'].astype(object)
+
+        return self._species_index
+
+    def _resolve_species(self, spp_guids, table_name):
+        """
+        Maps a column of species GUIDs to their USDA symbols. GUIDs that aren't in LocalSpecies come back as NaN and get
+        logged (and added to unknown_species), instead of stopping the whole file.
+
+        :param spp_guids: Series of LocalSpecies GUIDs
+        :param table_name: name of the table being built, for the log message
+        :return: Series of species symbols
+        """
+        species_index = self._species_symbols()
+        spp_guids = spp_guids.str.upper()
+
+        unknown = spp_guids[spp_guids.notna() & ~spp_guids.isin(species_index.index)].unique()
+        if len(unknown) > 0:
+            print(f"{len(unknown)} species GUIDs in {table_name} aren't in LocalSpecies.")
+            logging.warning(f"Unknown species GUIDs in {table_name}: {', '.join(unknown)}")
+            self.unknown_species.extend(guid for guid in unknown if guid not in self.unknown_species)
+
+        return spp_guids.map(species_index)
+
+    @timed(rows_in=lambda self: len(self['AttributeData']), rows_out=lambda self: self._total_rows('_Attribute'))
     def _attr_to_many(self):
         """
         Converts the AttributeData and AttributeRow tables into the many-tables format used by FFIMT
@@ -211,51 +323,45 @@ class FFIFile:
                          'AttributeRow_ModifiedBy': 'AttributeData_ModifiedBy',
                          'AttributeRow_ModifiedDate': 'AttributeData_ModifiedDate'}
 
-        attr_data = self['AttributeRow'] \
-            .merge(self['AttributeData'],
-                   left_on='AttributeRow_ID',
-                   right_on='AttributeData_DataRow_ID', how='left') \
-            .merge(self['MethodAttribute'],
-                   left_on='AttributeData_MethodAtt_ID',
-                   right_on='MethodAtt_ID', how='left') \
-            .merge(self['Method'],
-                   left_on='MethodAtt_Method_GUID',
-                   right_on='Method_GUID', how='left') \
-            .merge(self['SampleRow'],
-                   left_on='AttributeData_SampleRow_ID',
-                   right_on='SampleRow_ID', how='left') \
-            .merge(self['SampleData'],
-                   left_on='AttributeData_SampleRow_ID',
-                   right_on='SampleData_SampleRow_ID', how='left') \
-            .merge(self['SampleEvent'],
-                   left_on='SampleData_SampleEvent_GUID',
-                   right_on='SampleEvent_GUID', how='left')
-        try:
-            attr_select = attr_data[select_list]
-        except KeyError:  # these fields are in the SQL tables, but aren't included in the XML
-            # I can probably get rid of this, but I'm not sure how the indexing and renaming would work, so I'll
-            attr_data['AttributeRow_CreatedBy'] = pd.NA
-            attr_data['AttributeRow_CreatedDate'] = pd.NA
-            attr_data['AttributeRow_ModifiedBy'] = pd.NA
-            attr_data['AttributeRow_ModifiedDate'] = pd.NA
-            attr_select = attr_data[select_list]
+        # Only the distinct rows matter, since each method's rows get de-duplicated before pivoting. The JoinChain cuts
+        # each table down to the columns it needs first and joins Method/SampleEvent onto their small parent tables,
+        # rather than carrying every column of every table through all six merges.
+        attr_select = JoinChain(self['AttributeRow'], distinct=True) \
+            .left_join(self['AttributeData'],
+                       left_on='AttributeRow_ID',
+                       right_on='AttributeData_DataRow_ID') \
+            .left_join(self['MethodAttribute'],
+                       left_on='AttributeData_MethodAtt_ID',
+                       right_on='MethodAtt_ID') \
+            .left_join(self['Method'],
+                       left_on='MethodAtt_Method_GUID',
+                       right_on='Method_GUID') \
+            .left_join(self['SampleRow'],
+                       left_on='AttributeData_SampleRow_ID',
+                       right_on='SampleRow_ID') \
+            .left_join(self['SampleData'],
+                       left_on='AttributeData_SampleRow_ID',
+                       right_on='SampleData_SampleRow_ID') \
+            .left_join(self['SampleEvent'],
+                       left_on='SampleData_SampleEvent_GUID',
+                       right_on='SampleEvent_GUID') \
+            .execute(select_list)
 
         attr_long = attr_select.rename(columns=select_rename)  # renaming columns
-        methods = attr_long['Method_Name'].unique()  # get unique table names
-
-        # Iterates through each method name, subsets those data from the main dataset, and performs some transformations
-        for method in methods:
+        # Groups by method once and pivots each method's rows, rather than re-scanning the whole table for every method
+        # Pivots on the appropriate unique identifiers. Some of this behavior is artefactual of attempting to
+        # reproduce FFI tables, but that plan was abandoned, so some of this is superfluous to the actual code behavior.
+        # TODO: Remove superfluous code behavior
+        methods = pivot_by_group(attr_long, 'Method_Name',
+                                 index=['EventID', 'SampleData_SampleEvent_GUID',
+                                        'AttributeData_DataRow_GUID', 'Method_UnitSystem'],
+                                 columns='MethodAtt_FieldName',
+                                 values='AttributeData_Value',
+                                 drop_duplicates=True)  # make sure no duplicate data
+
+        # Iterates through each method name and performs some transformations on its table
+        for method, subset in methods:
             print(method)
-            temp = attr_long.loc[attr_long['Method_Name'] == method].drop_duplicates()  # make sure no duplicate data
-
-            # We have to take the subset before pivoting - this pivots on the appropriate unique identifiers
-            # Some of this behavior is artefactual of attempting to reproduce FFI tables, but that plan was abandoned,
-            # so some of this is superfluous to the actual code behavior.
-            # TODO: Remove superfluous code behavior
-            subset = temp.pivot(index=['EventID', 'SampleData_SampleEvent_GUID',
-                                       'AttributeData_DataRow_GUID', 'Method_UnitSystem'],
-                                columns=['MethodAtt_FieldName'],
-                                values='AttributeData_Value').reset_index()
             unit_systems = subset['Method_UnitSystem'].unique()
 
             # Normalize the table names from previous naming convention
@@ -264,12 +370,7 @@ class FFIFile:
             for col in subset.columns:
                 # Ensures species columns use the actual USDA code, not the Spp_GUID
                 if 'Spp' in col:
-                    spp_df = self['LocalSpecies']
-                    subset['Species'] = subset.apply(lambda row:
-                                                     spp_df.loc[
-                                                         spp_df['LocalSpecies_GUID'] == row[col].upper()
-                                                     ].iloc[0]['LocalSpecies_Symbol'],
-                                                     axis=1)
+                    subset['Species'] = self._resolve_species(subset[col], table_name)
 
             # Assign tree stem count to TreesIndv
             if method == 'Trees - Individuals':
@@ -288,8 +389,7 @@ class FFIFile:
 
             # Some tables have Metric and English unit systems. We need to break these out so we don't mess up the names
             if len(unit_systems) > 1:
-                for unit_system in unit_systems:
-                    unit_subset = subset.loc[subset['Method_UnitSystem'] == unit_system]
+                for unit_system, unit_subset in split_by(subset, 'Method_UnitSystem'):
                     if unit_system != 'English':
                         sql_table = f"{table_name}_{unit_system}_Attribute"
                     else:
@@ -301,6 +401,7 @@ class FFIFile:
                 subset.drop(columns=['Method_UnitSystem'], axis=1, inplace=True)  # Drop the unit column
                 self._data_map[sql_table] = subset  # Add table to our data map
 
+    @timed(rows_in=lambda self: len(self['SampleData']), rows_out=lambda self: self._total_rows('_Sample'))
     def _sample_to_many(self):
         """
         Breaks the methods into their SampleData components in a similar way as AttributeData.
@@ -339,22 +440,20 @@ class FFIFile:
 
         # Some weird stuff with FFI where the SampleData doesn't actually have GUID assigned, so we need to create one.
         sample_long['SampleData_Original_GUID'] = sample_long.apply(lambda _: str(uuid4()).upper())
-        methods = sample_long['Method_Name'].unique()
+        methods = pivot_by_group(sample_long, 'Method_Name',
+                                 index=['SampleData_SampleRow_GUID', 'SampleData_SampleEvent_GUID',
+                                        'SampleData_Original_GUID', 'SampleData_CreatedBy',
+                                        'SampleData_CreatedDate', 'SampleData_ModifiedBy',
+                                        'SampleData_ModifiedDate', 'Method_UnitSystem'],
+                                 columns='SampleAtt_FieldName',
+                                 values='SampleData_Value')
 
         # Iterate through each method and create a _Sample table for it.
-        for method in methods:
-            temp = sample_long.loc[sample_long['Method_Name'] == method]
-            subset = temp.pivot(index=['SampleData_SampleRow_GUID', 'SampleData_SampleEvent_GUID',
-                                       'SampleData_Original_GUID', 'SampleData_CreatedBy',
-                                       'SampleData_CreatedDate', 'SampleData_ModifiedBy',
-                                       'SampleData_ModifiedDate', 'Method_UnitSystem'],
-                                columns=['SampleAtt_FieldName'],
-                                values='SampleData_Value').reset_index()
+        for method, subset in methods:
             unit_systems = subset['Method_UnitSystem'].unique()
             table_name = method.replace(' ', '').replace('-', '_').replace('(', '_').replace(')', '_').strip('_')
             if len(unit_systems) > 1:
-                for unit_system in unit_systems:
-                    unit_subset = subset.loc[subset['Method_UnitSystem'] == unit_system]
+                for unit_system, unit_subset in split_by(subset, 'Method_UnitSystem'):
                     unit_subset.drop(columns=['Method_UnitSystem'], axis=1, inplace=True)
                     if unit_system != 'English':
                         sql_table = f"{table_name}_{unit_system}_Sample"
@@ -366,89 +465,13 @@ class FFIFile:
                 subset.drop(columns=['Method_UnitSystem'], axis=1, inplace=True)
                 self._data_map[sql_table] = subset
 
+    @timed(rows_in=lambda self: len(self['SampleEvent']), rows_out=lambda self: len(self['SampleEvent']))
     def _process_events(self):
         """
         SampleEvent needs some processing. Some of the FFI protocols have multiple "Personnel" columns that track
         who collected data and who recorded. This weird function combines all the FieldTeam and EntryTeam columns,
         respectively.
         """
-        def parse_list_val(val):
-            if (val is not None) and (str(val) != 'nan') and str(val) != '' and str(val) != ' ':
-                comma_parse = val.split(',')
-                comma_items = len(comma_parse)
-
-                space_parse = val.split(' ')
-                space_items = len(space_parse)
-
-                slash_parse = val.split('/')
-                slash_items = len(slash_parse)
-
-                if (comma_items == space_items and comma_items > 1) or (comma_items > 1 and space_items > 0):
-                    return [x.strip() for x in comma_parse]
-                elif comma_items == 1 and space_items > 1:
-                    return [x.strip() for x in space_parse]
-                elif slash_items > 1:
-                    return [x.strip() for x in slash_parse]
-                else:
-                    return [x.strip() for x in comma_parse]
-            else:
-                return []
-
-        def combine_teams(row, return_field):
-            duff_field = row['DuffFieldTeam']
-            duff_entry = row['DuffEntryTeam']
-            hr_field = row['HrFieldTeam']
-            hr_entry = row['HrEntryTeam']
-            fine_field = row['FineFieldTeam']
-            fine_entry = row['FineEntryTeam']
-            veg_field = row['VegFieldTeam']
-            veg_entry = row['VegEntryTeam']
-            trees_field = row['TreesFieldTeam']
-            trees_entry = row['TreesEntryTeam']
-            sap_field = row['SapFieldTeam']
-            sap_entry = row['SapEntryTeam']
-            seed_field = row['SeedFieldTeam']
-            seed_entry = row['SeedEntryTeam']
-
-            if return_field == 'FuelsObserver':
-                fuels_field = ', '.join(
-                    list(set(
-                        parse_list_val(duff_field) +
-                        parse_list_val(hr_field) +
-                        parse_list_val(fine_field) +
-                        parse_list_val(veg_field)
-                    ))
-                )
-                return fuels_field
-            elif return_field == 'FuelsRecorder':
-                fuels_entry = ', '.join(
-                    list(set(
-                        parse_list_val(duff_entry) +
-                        parse_list_val(hr_entry) +
-                        parse_list_val(fine_entry) +
-                        parse_list_val(veg_entry)
-                    ))
-                )
-                return fuels_entry
-            elif return_field == 'TreeObserver':
-                all_tree_field = ', '.join(
-                    list(set(
-                        parse_list_val(trees_field) +
-                        parse_list_val(sap_field) +
-                        parse_list_val(seed_field)
-                    ))
-                )
-                return all_tree_field
-            elif return_field == 'TreeRecorder':
-                all_tree_entry = ', '.join(
-                    list(set(
-                        parse_list_val(trees_entry) +
-                        parse_list_val(sap_entry) +
-                        parse_list_val(seed_entry)
-                    ))
-                )
-                return all_tree_entry
-
         self['SurfaceFuels_Duff_Litter_Sample']['DuffFieldTeam'] = self['SurfaceFuels_Duff_Litter_Sample']['FieldTeam']
         self['SurfaceFuels_Duff_Litter_Sample']['DuffEntryTeam'] = self['SurfaceFuels_Duff_Litter_Sample']['EntryTeam']
 
@@ -481,32 +504,66 @@ class FFIFile:
             self['Trees_Seedlings_HeightClass_Sample']['SeedEntryTeam'] = self['Trees_Seedlings_HeightClass_Sample'][
                 'FieldTeam']
 
+        team_tables = {'SurfaceFuels_Duff_Litter_Sample': ['DuffFieldTeam', 'DuffEntryTeam'],
+                       'SurfaceFuels_1000Hr_Sample': ['HrFieldTeam', 'HrEntryTeam'],
+                       'SurfaceFuels_Fine_Sample': ['FineFieldTeam', 'FineEntryTeam'],
+                       'SurfaceFuels_Vegetation_Sample': ['VegFieldTeam', 'VegEntryTeam'],
+                       'Trees_Individuals_Sample': ['TreesFieldTeam', 'TreesEntryTeam'],
+                       'Trees_Saplings_DiameterClass_Sample': ['SapFieldTeam', 'SapEntryTeam'],
+                       'Trees_Seedlings_HeightClass_Sample': ['SeedFieldTeam', 'SeedEntryTeam']}
+
+        # Only the team columns of the sample tables are needed. Bringing all their columns along gives the same names
+        # (FieldTeam, SampleData_SampleEvent_GUID, ...) from every table, which pandas 2 won't merge.
         temp_events = self['SampleEvent'] \
-            .merge(self['MacroPlot'], left_on='SampleEvent_Plot_GUID', right_on='MacroPlot_GUID', how='left') \
-            .merge(self['SurfaceFuels_Duff_Litter_Sample'], left_on='SampleEvent_GUID',
-                   right_on='SampleData_SampleEvent_GUID', how='left') \
-            .merge(self['SurfaceFuels_1000Hr_Sample'], left_on='SampleEvent_GUID',
-                   right_on='SampleData_SampleEvent_GUID', how='left') \
-            .merge(self['SurfaceFuels_Fine_Sample'], left_on='SampleEvent_GUID',
-                   right_on='SampleData_SampleEvent_GUID', how='left') \
-            .merge(self['SurfaceFuels_Vegetation_Sample'], left_on='SampleEvent_GUID',
-                   right_on='SampleData_SampleEvent_GUID', how='left') \
-            .merge(self['Trees_Individuals_Sample'], left_on='SampleEvent_GUID',
-                   right_on='SampleData_SampleEvent_GUID', how='left') \
-            .merge(self['Trees_Saplings_DiameterClass_Sample'], left_on='SampleEvent_GUID',
-                   right_on='SampleData_SampleEvent_GUID', how='left') \
-            .merge(self['Trees_Seedlings_HeightClass_Sample'], left_on='SampleEvent_GUID',
-                   right_on='SampleData_SampleEvent_GUID', how='left')
-        temp_events['FuelsObserver'] = temp_events.apply(combine_teams, args=('FuelsObserver',), axis=1)
-        temp_events['FuelsRecorder'] = temp_events.apply(combine_teams, args=('FuelsRecorder',), axis=1)
-        temp_events['TreeObserver'] = temp_events.apply(combine_teams, args=('TreeObserver',), axis=1)
-        temp_events['TreeRecorder'] = temp_events.apply(combine_teams, args=('TreeRecorder',), axis=1)
+            .merge(self['MacroPlot'], left_on='SampleEvent_Plot_GUID', right_on='MacroPlot_GUID', how='left')
+        for table, cols in team_tables.items():
+            teams = self[table][['SampleData_SampleEvent_GUID'] + cols] \
+                .rename(columns={'SampleData_SampleEvent_GUID': 'SampleEvent_GUID'})
+            temp_events = temp_events.merge(teams, on='SampleEvent_GUID', how='left')
+
+        # Split every team column into individual names once, then combine them into the four crew fields
+        team_fields = {'FuelsObserver': ['DuffFieldTeam', 'HrFieldTeam', 'FineFieldTeam', 'VegFieldTeam'],
+                       'FuelsRecorder': ['DuffEntryTeam', 'HrEntryTeam', 'FineEntryTeam', 'VegEntryTeam'],
+                       'TreeObserver': ['TreesFieldTeam', 'SapFieldTeam', 'SeedFieldTeam'],
+                       'TreeRecorder': ['TreesEntryTeam', 'SapEntryTeam', 'SeedEntryTeam']}
+        team_names = split_name_lists(temp_events, [col for cols in team_fields.values() for col in cols])
+        for field, cols in team_fields.items():
+            temp_events[field] = join_name_lists(team_names, cols, len(temp_events)).values
 
         # sel_events = temp_events[['EventID', 'PlotID', 'SampleEvent_Date', 'SampleEvent_GUID',
         #                           'SampleEvent_Comment', 'SampleEvent_Who', 'TreeObserver', 'TreeRecorder',
         #                           'FuelsObserver', 'FuelsRecorder']]
         self._data_map['SampleEvent'] = temp_events
 
+    @staticmethod
+    def _visit_ids(temp_df):
+        """
+        Builds VisitIDs a column at a time: ProjectID + visit year + monitoring status prefix, then the base if it's
+        'Fire', then the suffix ('Immediate' is shortened to 'Imm').
+        """
+        visit_year = temp_df['VisitYear']
+        year_str = visit_year.astype('Int64').astype(str).where(visit_year.notna(), '')
+
+        prefix = temp_df['MonitoringStatus_Prefix'].astype(str).str.strip(' ')
+
+        base = temp_df['MonitoringStatus_Base']
+        base_str = base.astype(str).str.strip(' ').where(base == 'Fire', '')
+
+        suffix = temp_df['MonitoringStatus_Suffix']
+        suffix_str = np.select([suffix == 'Immediate', suffix.notna()],
+                               [suffix.astype(str).str[:3], suffix.astype(str).str.strip(' ')],
+                               default='')
+
+        return temp_df['ProjectID'] + year_str + prefix + base_str + suffix_str
+
+    @staticmethod
+    def _project_ids(project_names):
+        """
+        ProjectIDs are the project unit names with the underscores and spaces taken out
+        """
+        return project_names.str.replace(r'[_ ]', '', regex=True)
+
+    @timed(rows_in=lambda self: len(self['SampleEvent']), rows_out=lambda self: len(self['ProjectVisit']))
     def _process_projects(self):
         """
         Projects also need some processing; we need to extract the year for visits and construct a VisitID.
@@ -527,24 +584,7 @@ class FFIFile:
                    right_on='ProjectUnit_GUID')
 
         temp_df['VisitYear'] = pd.DatetimeIndex(temp_df['SampleEvent_Date']).year
-        temp_df['VisitID'] = temp_df.apply(lambda row: row['ProjectID'] + (
-                                                        str(int(row['VisitYear']))
-                                                        if not pd.isna(row['VisitYear']) else ''
-                                                        ) +
-                                                       str(row['MonitoringStatus_Prefix']).strip(' ') +
-                                                       (
-                                                            str(row['MonitoringStatus_Base']).strip(' ')
-                                                            if row['MonitoringStatus_Base'] == 'Fire' else ''
-                                                       ) +
-                                                       (
-                                                           str(row['MonitoringStatus_Suffix']).strip(' ')
-                                                           if (not pd.isna(row['MonitoringStatus_Suffix'])) and (row['MonitoringStatus_Suffix'] != 'Immediate')
-                                                           else
-                                                               str(row['MonitoringStatus_Suffix'])[:3]
-                                                               if row['MonitoringStatus_Suffix'] == 'Immediate'
-                                                               else ''
-                                                        ),
-                                           axis=1)
+        temp_df['VisitID'] = self._visit_ids(temp_df)
 
         # Join the new data onto Event and write that (and ProjectVisit) to our data map
         event_df = self['SampleEvent'] \
@@ -556,52 +596,67 @@ class FFIFile:
         self._data_map['SampleEvent'] = event_df
         self._data_map['ProjectVisit'] = temp_df
 
-    def _insert_into_db(self, ffi_db, table):
+    def _log_frames(self, table_name, inserted, inserted_keys):
+        """
+        the rows for UpdateLog and UpdateLogKeys describing one insert
+        """
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        change_df = DataFrame({'User': [self._user],
+                               'Time': [now],
+                               'Table': [table_name],
+                               'ChangeType': ['INSERT'],
+                               'Changes': [inserted]})
+        key_df = DataFrame({'User': self._user,
+                            'Time': now,
+                            'Table': table_name,
+                            'File': self.file,
+                            'PrimaryKey': pd.Series(['|'.join(str(val) for val in key) for key in inserted_keys],
+                                                    dtype=object)})
+        return change_df, key_df
+
+    def _create_log_tables(self, ffi_db):
+        """
+        Makes sure UpdateLog and UpdateLogKeys exist before any tables load, so parallel loads don't race to create them
+        """
+        inspector = sa_inspect(ffi_db.engine)
+        change_df, key_df = self._log_frames('', 0, [])
+        for log_table, df in [('UpdateLog', change_df), ('UpdateLogKeys', key_df)]:
+            if not inspector.has_table(log_table):
+                df.head(0).to_sql(log_table, ffi_db.engine, index=False)
+
+    def _log_changes(self, conn, table_name, inserted, inserted_keys):
+        """
+        Writes who inserted what into our logging tables: a summary row in UpdateLog, and the primary key of every
+        inserted row (when the database returns them) in UpdateLogKeys. Both are written in bulk on the loading
+        connection, so they're committed along with the rows they describe.
         """
-        Checks foreign key constraints and inserts any necessary tables first.
+        if inserted <= 0:
+            return
 
-        Then generates a MERGE INTO statement directly creating a query with the data values and executes that statement
+        change_df, key_df = self._log_frames(table_name, inserted, inserted_keys or [])
+        change_df.to_sql('UpdateLog', conn, if_exists='append', index=False)
+        if not key_df.empty:
+            key_df.to_sql('UpdateLogKeys', conn, if_exists='append', index=False)
+
+    @timed(name=lambda self, ffi_db, table: f'_insert_into_db:{table}',
+           rows_in=lambda self, ffi_db, table: len(self._data_map.get(table, ())))
+    def _insert_into_db(self, ffi_db, table):
+        """
+        Stages the data in a temp table and merges it into the database table with a BulkLoader. Foreign key
+        dependencies are handled by load, which calls this in dependency order; each table only gets inserted once.
 
         :param ffi_db: FFIDatabase object representing the database connection
         :param table: the table to be inserted into the database, as a string
         """
+        if table in self._processed:
+            return
 
-        # Next block pulls in the field and table mappings that were built for the old column and table names to align
-        # with the new ones.
-        table_map = pd.read_csv("extra/TableMap.csv")
-        field_map = pd.read_csv("extra/FieldMap.csv")
-        field_map['TableName'] = field_map.apply(lambda r: r['TableName'].strip(), axis=1)
-        field_map['OldColumn'] = field_map.apply(lambda r: str(r['OldColumn']).strip(), axis=1)
-        field_map['ColumnName'] = field_map.apply(lambda r: r['ColumnName'].strip(), axis=1)
-
-        this_table_map = table_map.loc[table_map['FFITable'] == table]
-        if not this_table_map.empty:
-            new_table_name = this_table_map['NewTable'].values[0]
-            table_name = new_table_name
-
-            temp_field_map = field_map.loc[field_map['TableName'] == table_name]
-            this_field_map = dict(zip(list(temp_field_map['OldColumn']), list(temp_field_map['ColumnName'])))
-            table_fields = [col for col in list(temp_field_map['OldColumn']) if col != 'nan']
-
-            # handle key constraints
-            pks = ffi_db.get_primary_keys()
-            fks = ffi_db.get_foreign_keys()
-
-            table_fks = fks[table_name]
-            table_pks = pks[table_name]
-            # multi_pk = len(table_pks) > 1
-
-            # we need to ensure that the tables on which there are foreign key constraints are entered before we upload
-            # new data to the current table. This will produce a recursive pattern to insert all dependencies first.
-            if len(table_fks) > 0:
-                for const in table_fks:
-                    const_list = table_fks[const]
-                    for tup in const_list:
-                        add_table = tup[0]
-                        if add_table not in self._processed and \
-                                add_table in self._data_map:
-                            print(f'Adding foreign key dependency: {add_table}')
-                            self._insert_into_db(ffi_db, add_table)
+        # The field and table mappings that were built for the old column and table names to align with the new ones
+        mappings = get_registry()
+        table_name = mappings.target_table(table)
+        if table_name is not None:
+            this_field_map = mappings.field_map(table_name)
+            table_fields = list(this_field_map)
 
             xml_table = self[table]
             select_fields = [field for field in table_fields if field in xml_table.columns]
@@ -610,91 +665,59 @@ class FFIFile:
             if table == 'ProjectVisit':
                 final_table.drop_duplicates(inplace=True)
 
-            # Construct the VALUES part of the statement
-            val_list = []
-            col_list = []
-            null_cols = []
-
-            # enumerate rows and each value in each row
-            for _, row in final_table.iterrows():
-                row_vals = []
-                for idx, val in enumerate(row):
-                    col = final_table.columns[idx]
-                    col_type = final_table[col].dtype
-                    new_col = this_field_map[col]
-
-                    if new_col not in col_list:
-                        col_list.append(new_col)
-
-                    # make sure strings get tick marks and ' is converted to '' for the SQL
-                    if col_type in ['float64', 'int64', 'boolean']:
-                        row_vals.append(str(val))
-                    elif (val is None) or (str(val) == 'nan') or (new_col == 'Offset' and val in ['False', 'True']):
-                        row_vals.append('NULL')
-                    else:
-                        row_vals.append(f"""'{str(val).replace("'", "''")}'""")
-                val_list.append(f"({', '.join(row_vals)})")
-
-            values_part = ', '.join(val_list)
-
-            # constructs comma-delimited lists of column names
-            cols_str = ', '.join(col_list)
-            source_cols = [f'source.{c}'
-                           for c in col_list]
-            source_col_str = ', '.join(source_cols)
-
-            # Constructs identity relations for primary keys
-            pk_strings = [f'target.{pk} = source.{pk}'
-                          for pk in table_pks]
-            pk_part = ' AND '.join(pk_strings)
-
-            # Generate the full MERGE INTO statement
-            merge_into_sql = f"""
-            MERGE INTO {table_name} AS target
-            USING (
-                VALUES
-                    {values_part}
-                )
-                AS source ({cols_str})
-                ON {pk_part}
-            WHEN NOT MATCHED THEN
-                INSERT ({cols_str})
-                VALUES ({source_col_str});
-            """
+            # rename to the database column names
+            final_table.rename(columns=this_field_map, inplace=True)
+            if 'Offset' in final_table.columns:
+                # FFI sometimes puts booleans in Offset, which don't belong in the database
+                final_table.loc[final_table['Offset'].isin(['False', 'True']), 'Offset'] = None
+
+            table_pks = ffi_db.get_primary_keys()[table_name]
+            fingerprinted = self._fingerprints is not None and len(table_pks) > 0
+            if fingerprinted:
+                # only send rows that are new or changed since they were last inserted. This is done on the final rows,
+                # after transform has numbered stems, witness trees etc. across the whole export. A fresh index, so the
+                # batches' rows can be matched back to their fingerprints by label.
+                final_table = final_table.reset_index(drop=True)
+                row_keys = FingerprintStore.row_keys(final_table, table_pks)
+                row_hashes = FingerprintStore.row_hashes(final_table)
+                changed = self._fingerprints.changed(table_name, row_keys, row_hashes)
+                final_table = final_table.loc[changed]
+                row_keys, row_hashes = row_keys[changed], row_hashes[changed]
+
+            # Fingerprints get saved as each batch commits, so on a retry the rows that made it in are left out and the
+            # checkpoint's batch numbers wouldn't line up anymore. The same goes for rows the key cache leaves out.
+            checkpoint = None if fingerprinted else self._checkpoint
+            if self._key_cache:
+                # rows that are already in the database would just be skipped by the MERGE, so don't send them. That
+                # leaves out rows committed by an earlier try too, which throws off the checkpoint's batch numbers.
+                new = self._key_cache.new_rows(table_name, final_table, self.admin_unit)
+                print(f"{(~new).sum()} of {len(final_table)} rows for {table_name} are already in the database.")
+                logging.info(f"{(~new).sum()} of {len(final_table)} rows for {table_name} are already in the database")
+                final_table = final_table.loc[new]
+                checkpoint = None
 
             with ffi_db.start_session() as sesh:
                 try:
-                    count_sql = f"SELECT COUNT(*) AS Size FROM {table_name}"
-                    before_df = pd.read_sql(count_sql, sesh.bind)  # Compare before and after row count of tables
-                    before_count = before_df['Size'].values[0]
-
-                    # Insert data
-                    sesh.execute(merge_into_sql)
-                    sesh.commit()
-
-                    # Get count after insert
-                    after_df = pd.read_sql(count_sql, sesh.bind)
-                    after_count = after_df['Size'].values[0]
-
-                    count_diff = after_count - before_count
-
-                    # Then we insert into our logging table for who made changes to the database tables
-                    if count_diff != 0:
-                        change_type = "INSERT" if count_diff > 0 else "DELETE"
-
-                        # handle datetime
-                        dt = str(datetime.datetime.now())
-                        new_dt = re.findall(r'(.*)\.\d{4}', dt)[0]
-
-                        # construct log data and insert
-                        change_df = DataFrame({'User': [self._user],
-                                               'Time': [new_dt],
-                                               'Table': [table_name],
-                                               'ChangeType': [change_type],
-                                               'Changes': [abs(count_diff)]})
-                        change_df.to_sql('UpdateLog', sesh.bind, if_exists='append', index=False)
+                    # Insert data, committing (and logging) as each batch lands
+                    loader = BulkLoader(ffi_db, batch_size=self._batch_size)
+                    on_commit = partial(self._save_fingerprints, ffi_db, row_keys, row_hashes) if fingerprinted \
+                        else None
+                    stats = loader.load_batches(sesh, table_name, final_table, checkpoint,
+                                                on_batch=self._log_changes, on_commit=on_commit)
+
+                    count_diff = sum(batch['inserted'] for batch in stats)
+                    record = self.metrics.current()
+                    record['rows_out'] = count_diff
+                    record['sql_bytes'] = loader.bytes_sent
                     print(f"Inserted {count_diff} rows into {table_name}.")
                     logging.info(f"Inserted {count_diff} rows into {table_name}.")
+                    self._processed.append(table)
+                    if self._key_cache:
+                        self._key_cache.add(table_name, final_table, self.admin_unit)
+                    if fingerprinted and count_diff < len(final_table):
+                        logging.info(f"{len(final_table) - count_diff} new or changed rows for {table_name} weren't "
+                                     f"inserted, since their keys are already in the database. Their fingerprints "
+                                     f"aren't saved, so they'll be checked again next time.")
 
                 except Exception as e:
                     # If there's any issues merging the data, throw an error and rollback the MERGE
@@ -706,34 +729,83 @@ class FFIFile:
                         print(error)
                         logging.exception(f"Failed to insert data for {table_name}.")
 
-    def extract(self):
+    def _save_fingerprints(self, ffi_db, row_keys, row_hashes, table_name, chunk, inserted, inserted_keys):
+        """
+        Records the fingerprints of the rows in a committed batch that the MERGE actually inserted. Rows it skipped
+        because their keys were already there (e.g. rows that changed in FFI after they were first loaded, since the
+        MERGE only inserts) don't get saved, so they aren't mistaken for rows that are in the database as they are now.
+
+        :param ffi_db: FFIDatabase object representing the database connection
+        :param row_keys: fingerprint keys of the rows being loaded, indexed like the batch
+        :param row_hashes: fingerprint hashes of the rows being loaded, indexed like the batch
+        :param table_name: name of the table in the database
+        :param chunk: the batch as it was sent
+        :param inserted: number of rows the MERGE inserted
+        :param inserted_keys: primary key tuples of the inserted rows, or None if the dialect can't return them
+        """
+        if inserted_keys is None:
+            # without the keys there's no telling which rows went in, unless they all did
+            landed = chunk.index if inserted == len(chunk) else chunk.index[:0]
+        else:
+            table = ffi_db.tables[table_name]
+            pks = ffi_db.get_primary_keys()[table_name]
+            returned = typed_keys(pd.DataFrame(inserted_keys, columns=pks), table, pks)
+            landed = chunk.index[typed_keys(chunk, table, pks).isin(returned).to_numpy()]
+        self._fingerprints.save(table_name, row_keys[landed], row_hashes[landed])
+
+    @timed(rows_out=lambda self, *args, **kwargs: self._total_rows())
+    def extract(self, cache=None):
+        """
+        Reads the tables out of the XML file and generates the PlotIDs and EventIDs.
+
+        :param cache: optional ExportCache. If this file has been extracted before (by the same code), the tables are
+            read from the cache instead of the XML; otherwise they get cached for next time.
+        """
 
         print(f"Reading data for {self.file}")
         logging.info(f"Transforming tables for {self.file}")
-        self._parse_data()
-        self._parse_idents()
+        if cache is None or not cache.restore(self, 'extract'):
+            self._parse_data()
+            self._parse_idents()
+            if cache is not None:
+                cache.store(self, 'extract')
+        if self._compact:
+            for table_name, df in self._data_map.items():
+                self._data_map[table_name] = compact_frame(df)
         self.version = self['Schema_Version']['Schema_Version'][0]
         self.admin_unit = self['RegistrationUnit']['RegistrationUnit_Name'][0]
 
+    def _total_rows(self, suffix=''):
+        """
+        :param suffix: only count tables whose names end with this
+        :return: total rows across the tables in the data map
+        """
+        return sum(len(df) for table, df in self._data_map.items() if table.endswith(suffix))
+
+    def memory_report(self):
+        """
+        :return: DataFrame of the rows, columns and MB of memory used by each table, biggest first
+        """
+        return memory_report(self._data_map)
+
+    @timed(rows_in=lambda self: self._total_rows(), rows_out=lambda self: self._total_rows())
     def transform(self):
 
         self._attr_to_many()
         self._sample_to_many()
 
         # need to normalize project names for ProjectID
-        self['ProjectUnit']['ProjectID'] = self['ProjectUnit'].apply(
-            lambda row: row['ProjectUnit_Name'].replace('_', '').replace(' ', ''),
-            axis=1
-        )
+        self['ProjectUnit']['ProjectID'] = self._project_ids(self['ProjectUnit']['ProjectUnit_Name'])
 
         # add admin unit for data quality
         self['ProjectUnit']['AdminUnit'] = self.admin_unit
         self['MacroPlot']['AdminUnit'] = self.admin_unit
 
-        # Create transects from SurfaceFuels_Fine_Attribute
-        temp_df = self['SurfaceFuels_Fine_Attribute'][['EventID', 'Transect', 'Azimuth', 'Slope']].drop_duplicates()
-        temp_df['Length'] = 75
-        self['Transect'] = temp_df
+        # Create transects from SurfaceFuels_Fine_Attribute (which won't be there if the export has no fine fuels data)
+        if 'SurfaceFuels_Fine_Attribute' in self._data_map:
+            temp_df = self['SurfaceFuels_Fine_Attribute'][['EventID', 'Transect', 'Azimuth', 'Slope']].drop_duplicates()
+            temp_df['Length'] = 75
+            self['Transect'] = temp_df
 
         self._process_events()
         self._process_projects()
@@ -745,15 +817,82 @@ class FFIFile:
 
         self.many_tables = True
 
-    def load(self, ffi_db):
+    def load_plan(self, ffi_db):
         """
-        Iterates through each table in the data map and inserts it into the database
+        :param ffi_db: FFIDatabase object representing the database connection
+        :return: LoadPlan of the tables in the data map, ordered so parent tables load before the tables referencing them
+        """
+        tables = [table for table in self._data_map if table not in self._excluded]
+        return LoadPlan.build(tables, ffi_db)
+
+    def _insert_table(self, ffi_db, table):
+        """
+        _insert_into_db, with any error that makes it out of there (e.g. reading the keys or fingerprints the rows are
+        checked against) caught so it only fails that table and not the whole run
+        """
+        try:
+            self._insert_into_db(ffi_db, table)
+        except Exception as e:
+            print(f"Failed to insert data for {table}: {e}")
+            logging.exception(f"Failed to insert data for {table}.")
+            self.insert_failed.append(table)
+
+    def _load_level(self, ffi_db, level, workers):
+        """
+        Loads one level of the load plan. The tables in a level don't reference each other, so they're loaded on a
+        thread pool, each with its own connection from the FFIDatabase pool.
+        """
+        with ThreadPoolExecutor(max_workers=min(workers, len(level))) as pool:
+            futures = [pool.submit(self._insert_table, ffi_db, table) for table in level]
+            for future in as_completed(futures):
+                future.result()
+
+    @timed(rows_in=lambda self, *args, **kwargs: self._total_rows())
+    def load(self, ffi_db, batch_size=None, checkpoint_path=None, workers=1, key_cache=None):
+        """
+        Inserts each table in the data map into the database, in foreign key dependency order
+
+        :param ffi_db: FFIDatabase object representing the database connection
+        :param batch_size: rows per MERGE/commit. None loads each table in one go.
+        :param checkpoint_path: optional JSON file recording the batches that have been committed, so a re-run after a
+            failure skips them (as long as the file's contents haven't changed). The file's entry is cleared once
+            everything loads.
+        :param workers: number of tables to load at the same time, within each level of the load plan. This is capped
+            at the size of the FFIDatabase connection pool.
+        :param key_cache: optional KeyCache of the keys already in the database, shared by the files in a run. Rows
+            whose keys are in it aren't sent to the database at all.
         """
         print(f'Inserting data for {self.file}')
         logging.info(f"Inserting data for {self.file}")
-        for table in self._data_map:
-            if table not in self._excluded:
-                self._insert_into_db(ffi_db, table)
+        self._batch_size = batch_size
+        self._key_cache = key_cache
+        if checkpoint_path:
+            self._checkpoint = LoadCheckpoint(checkpoint_path, self.file, batch_size, file_hash(self._source))
+
+        load_record = self.metrics.current()
+        first_stage = len(self.metrics.stages)
+
+        self._create_log_tables(ffi_db)
+        plan = self.load_plan(ffi_db)
+        print(plan)
+        logging.info(str(plan))
+        workers = min(workers, ffi_db.pool_size)
+        for level in plan.levels:
+            if workers > 1 and len(level) > 1:
+                self._load_level(ffi_db, level, workers)
+            else:
+                for table in level:
+                    self._insert_table(ffi_db, table)
+
+        table_loads = [record for record in self.metrics.stages[first_stage:] if record['parent'] == 'load']
+        load_record['rows_out'] = sum(record['rows_out'] or 0 for record in table_loads)
+        load_record['sql_bytes'] = sum(record['sql_bytes'] or 0 for record in table_loads)
+
+        if len(self.insert_failed) > 0:
+            print(f"Failed tables for {self.file}: {', '.join(self.insert_failed)}")
+
+        if len(self.insert_failed) == 0 and self._checkpoint:
+            self._checkpoint.clear()
 
     def tables_to_csv(self):
 
@@ -0,0 +1,10 @@
+import logging
+import os
+import sys
+
+# parser.xml sets up logging to a file on the original author's machine when it's imported. Setting logging up first
+# keeps the tests' log on the console instead.
+logging.basicConfig(level=logging.WARNING)
+os.environ.setdefault('USERNAME', 'tests')
+os.environ.setdefault('COMPUTERNAME', 'tests')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+import pandas as pd
+from parser.functions import convert_datetime_series
+
+
+def _local(value):
+    return value.astimezone().replace(tzinfo=None)
+
+
+def test_convert_datetime_series_regular_values():
+    series = pd.Series(['2020-05-06T10:00:00', '2020-05-06T10:00:00.1234567', None], dtype=object)
+    assert convert_datetime_series(series).tolist() == ['2020-05-06T10:00:00', '2020-05-06T10:00:00.123', None]
+
+
+def test_convert_datetime_series_out_of_range_years():
+    # FFI uses 0001-01-01 for "no date", which is outside what datetime64[ns] can hold, as are years after 2262
+    series = pd.Series(['0001-01-01T00:00:00-07:00', '2020-05-06T10:00:00', '9999-12-31T23:59:59.5',
+                        '1650-03-04T00:00:00', None], dtype=object)
+    sentinel = _local(datetime(1, 1, 1, 7, tzinfo=timezone.utc)).isoformat(timespec='seconds')
+
+    result = convert_datetime_series(series)
+
+    assert result.tolist() == [sentinel, '2020-05-06T10:00:00', '9999-12-31T23:59:59.500', '1650-03-04T00:00:00',
+                               None]
+
+
+def test_convert_datetime_series_all_missing():
+    series = pd.Series([None, None], dtype=object)
+    assert convert_datetime_series(series).isna().all()
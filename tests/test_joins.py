@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+from parser.joins import JoinChain
+
+
+def _keys(rng, n, pool, null_share=0.1):
+    """
+    n string keys drawn from pool (so some repeat and some don't match anything), with some nulls
+    """
+    keys = rng.choice(pool, n).astype(object)
+    keys[rng.random(n) < null_share] = None
+    return keys
+
+
+def _tables(seed):
+    """
+    tables shaped like the attribute chain: rows, their values, the columns the values belong to, and so on, with
+    repeated, null and unmatched keys on every side
+    """
+    rng = np.random.default_rng(seed)
+    ids = [f'K{idx}' for idx in range(12)]
+    rows = pd.DataFrame({'Row_ID': _keys(rng, 30, ids), 'Row_Event': _keys(rng, 30, ids),
+                         'Row_Note': rng.choice(['a', 'b', None], 30)})
+    data = pd.DataFrame({'Data_Row_ID': _keys(rng, 60, ids), 'Data_Att_ID': _keys(rng, 60, ids),
+                         'Data_Sample_ID': _keys(rng, 60, ids), 'Data_Value': rng.choice(['1', '2', '3', None], 60)})
+    atts = pd.DataFrame({'Att_ID': _keys(rng, 10, ids), 'Att_Method': _keys(rng, 10, ids),
+                         'Att_Name': rng.choice(['DBH', 'Ht', None], 10)})
+    methods = pd.DataFrame({'Method_ID': _keys(rng, 8, ids), 'Method_Name': rng.choice(['Trees', 'Fuels'], 8)})
+    samples = pd.DataFrame({'Sample_ID': _keys(rng, 15, ids), 'Sample_Created': rng.choice(['x', 'y'], 15)})
+    events = pd.DataFrame({'Event_ID': _keys(rng, 10, ids), 'Event_Date': rng.choice(['2020', '2021', None], 10)})
+    return rows, data, atts, methods, samples, events
+
+
+def _joins(rows, data, atts, methods, samples, events):
+    return [(data, 'Row_ID', 'Data_Row_ID'), (atts, 'Data_Att_ID', 'Att_ID'), (methods, 'Att_Method', 'Method_ID'),
+            (samples, 'Data_Sample_ID', 'Sample_ID'), (events, 'Row_Event', 'Event_ID')]
+
+
+def _merge_chain(tables):
+    merged = tables[0]
+    for df, left_on, right_on in _joins(*tables):
+        merged = merged.merge(df, left_on=left_on, right_on=right_on, how='left')
+    return merged
+
+
+def _join_chain(tables, distinct):
+    chain = JoinChain(tables[0], distinct=distinct)
+    for df, left_on, right_on in _joins(*tables):
+        chain.left_join(df, left_on=left_on, right_on=right_on)
+    return chain
+
+
+COLUMNS = [
+    ['Row_ID', 'Data_Value', 'Att_Name', 'Method_Name', 'Sample_Created', 'Event_Date'],
+    # keys from the joined tables, and columns that leave whole tables out
+    ['Method_Name', 'Att_ID', 'Data_Value', 'Row_Note'],
+    ['Event_Date', 'Row_ID'],
+]
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('columns', COLUMNS)
+def test_join_chain_matches_merge_chain(seed, columns):
+    tables = _tables(seed)
+    expected = _merge_chain(tables)[columns].reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(_join_chain(tables, distinct=False).execute(columns), expected)
+
+    # with distinct, only the distinct rows (in the same order) have to match
+    distinct = _join_chain(tables, distinct=True).execute(columns)
+    pd.testing.assert_frame_equal(distinct.drop_duplicates().reset_index(drop=True),
+                                  expected.drop_duplicates().reset_index(drop=True))
+
+
+def test_join_chain_null_keys_match_null_keys():
+    # pandas matches null keys to null keys, including the nulls a row gets from a table it didn't match (Z), so Z
+    # picks up the attribute with no ID and both of its methods
+    rows = pd.DataFrame({'Row_ID': ['A', 'B', None, 'Z']})
+    data = pd.DataFrame({'Data_Row_ID': ['A', 'B', None], 'Data_Att_ID': ['K1', None, 'K3']})
+    atts = pd.DataFrame({'Att_ID': ['K1', None], 'Att_Method': ['M1', 'M6']})
+    methods = pd.DataFrame({'Method_ID': ['M1', 'M6', 'M6', None], 'Method_Name': ['one', 'six', 'six', 'none']})
+    tables = [(data, 'Row_ID', 'Data_Row_ID'), (atts, 'Data_Att_ID', 'Att_ID'), (methods, 'Att_Method', 'Method_ID')]
+    expected = rows
+    chain = JoinChain(rows)
+    for df, left_on, right_on in tables:
+        expected = expected.merge(df, left_on=left_on, right_on=right_on, how='left')
+        chain.left_join(df, left_on=left_on, right_on=right_on)
+    expected = expected[['Row_ID', 'Method_Name']]
+
+    assert expected['Method_Name'].tolist() == ['one', 'six', 'six', 'none', 'six', 'six']
+    pd.testing.assert_frame_equal(chain.execute(['Row_ID', 'Method_Name']), expected)
+
+
+def test_join_chain_unknown_column():
+    with pytest.raises(KeyError):
+        JoinChain(pd.DataFrame({'Row_ID': ['K1']})).execute(['Missing'])
@@ -0,0 +1,48 @@
+import datetime
+import pandas as pd
+from sqlalchemy import Column, MetaData, Table, create_engine, insert
+from sqlalchemy.types import DateTime, Float, String
+from parser.keys import KeyCache
+from parser.server import FFIDatabase
+
+
+def _key_cache():
+    engine = create_engine('sqlite://')
+    meta = MetaData()
+    events = Table('Event', meta, Column('EventID', String(50), primary_key=True), Column('Comment', String(50)))
+    trees = Table('TreesIndv', meta, Column('EventID', String(50), primary_key=True),
+                  Column('TagNum', Float, primary_key=True), Column('Measured', DateTime, primary_key=True),
+                  Column('DBH', Float))
+    meta.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(events), [{'EventID': 'ELMALPLOT0120200101'}, {'EventID': 'ELMALPLOT0220200101'},
+                                      {'EventID': 'OTHERPLOT0120200101'}])
+        conn.execute(insert(trees), [{'EventID': 'ELMALPLOT0120200101', 'TagNum': 1.0,
+                                      'Measured': datetime.datetime(2020, 1, 1, 9, 30)}])
+    return KeyCache(FFIDatabase(engine))
+
+
+def test_new_rows_narrows_to_the_normalized_admin_unit():
+    key_cache = _key_cache()
+    df = pd.DataFrame({'EventID': ['ELMALPLOT0120200101', 'ELMALPLOT0220200101', 'ELMALPLOT0320200101'],
+                       'Comment': [None, 'a', 'b']})
+
+    new = key_cache.new_rows('Event', df, admin_unit='El Malpais NM')
+
+    assert new.tolist() == [False, False, True]
+    # just the admin unit's keys get read
+    assert len(key_cache._keys[('Event', 'El Malpais NM')]) == 2
+
+
+def test_new_rows_compares_typed_keys():
+    # the XML has '1' and an ISO timestamp, while the database gives back 1.0 and a datetime
+    key_cache = _key_cache()
+    df = pd.DataFrame({'EventID': ['ELMALPLOT0120200101', 'ELMALPLOT0120200101'],
+                       'TagNum': ['1', '2'],
+                       'Measured': ['2020-01-01T09:30:00', '2020-01-01T09:30:00'],
+                       'DBH': ['10', '12']})
+
+    assert key_cache.new_rows('TreesIndv', df, admin_unit='El Malpais NM').tolist() == [False, True]
+
+    key_cache.add('TreesIndv', df, admin_unit='El Malpais NM')
+    assert key_cache.new_rows('TreesIndv', df, admin_unit='El Malpais NM').tolist() == [False, False]
@@ -0,0 +1,17 @@
+from parser.cache import file_hash
+from parser.loader import LoadCheckpoint
+
+
+def test_checkpoint_is_only_reused_for_the_same_contents(tmp_path):
+    export = tmp_path / 'export.xml'
+    export.write_text('<FFI>first</FFI>')
+    path = str(tmp_path / 'load_checkpoint.json')
+
+    checkpoint = LoadCheckpoint(path, 'export', 100, file_hash(export))
+    checkpoint.record('TreesIndv', 3)
+    assert LoadCheckpoint(path, 'export', 100, file_hash(export)).last_batch('TreesIndv') == 3
+    assert LoadCheckpoint(path, 'export', 50, file_hash(export)).last_batch('TreesIndv') == -1
+
+    # a new export saved under the same name starts over
+    export.write_text('<FFI>second</FFI>')
+    assert LoadCheckpoint(path, 'export', 100, file_hash(export)).last_batch('TreesIndv') == -1
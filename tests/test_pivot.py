@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+from parser.memory import compact_frame
+from parser.pivot import pivot_by_group
+
+INDEX = ['EventID', 'DataRow', 'UnitSystem']
+
+
+def _long_table(seed, n=200):
+    """
+    a long table like the one _attr_to_many pivots, with nulls in every column. Depending on the seed, some cells have
+    more than one value, some rows are exact duplicates, or neither.
+    """
+    rng = np.random.default_rng(seed)
+
+    def pick(pool, null_share=0.05):
+        values = rng.choice(np.array(pool, dtype=object), n)
+        values[rng.random(n) < null_share] = None
+        return values
+
+    long_df = pd.DataFrame({'EventID': pick(['E2', 'E1', 'E10']),
+                            'DataRow': pick([f'R{idx}' for idx in range(40)]),
+                            'UnitSystem': pick(['Metric', 'English'], 0.02),
+                            'FieldName': pick(['DBH', 'Ht', 'Status', 'Comment'], 0.02),
+                            'Value': pick(['1.5', '2', 'L', 'D', ''], 0.2),
+                            'Method': pick(['Trees', 'Fuels', 'Cover'], 0.02)})
+    if seed % 3:
+        long_df = long_df.drop_duplicates(['Method'] + INDEX + ['FieldName'])
+    if seed % 3 < 2:
+        long_df = pd.concat([long_df, long_df.sample(20, random_state=seed)])
+    return long_df.reset_index(drop=True)
+
+
+def _tables(pivots):
+    """
+    :return: list of (group, wide table), or the error a group's pivot raised in place of its table
+    """
+    tables = []
+    try:
+        for key, wide in pivots:
+            tables.append((key, wide))
+    except ValueError as e:
+        tables.append(('error', str(e)))
+    return tables
+
+
+def _masked(long_df, drop_duplicates):
+    """
+    how the tables were made before pivot_by_group: mask the long table for each method and pivot that
+    """
+    for key in long_df['Method'].dropna().unique():
+        group = long_df.loc[long_df['Method'] == key]
+        if drop_duplicates:
+            group = group.drop_duplicates()
+        yield key, group.pivot(index=INDEX, columns=['FieldName'], values='Value').reset_index()
+
+
+def _assert_same(result, expected, nulls_as_nan=False):
+    """
+    :param nulls_as_nan: compare None in the expected tables as NaN, for compact tables, whose categoricals keep every
+        null as NaN
+    """
+    assert [key for key, _ in result] == [key for key, _ in expected]
+    for (_, wide), (_, expected_wide) in zip(result, expected):
+        if isinstance(expected_wide, str):
+            assert wide == expected_wide
+        else:
+            if nulls_as_nan:
+                expected_wide = expected_wide.mask(expected_wide.isna(), np.nan)
+            pd.testing.assert_frame_equal(wide, expected_wide)
+
+
+@pytest.mark.parametrize('seed', range(12))
+@pytest.mark.parametrize('drop_duplicates', [False, True])
+def test_pivot_by_group_matches_masked_pivot(seed, drop_duplicates):
+    long_df = _long_table(seed)
+    expected = _tables(_masked(long_df, drop_duplicates))
+
+    _assert_same(_tables(pivot_by_group(long_df, 'Method', INDEX, 'FieldName', 'Value', drop_duplicates)), expected)
+
+    # compact tables (categoricals, pyarrow strings) give the same wide tables as the plain object ones
+    compact = compact_frame(long_df, min_rows=0)
+    assert isinstance(compact['Method'].dtype, pd.CategoricalDtype)
+    _assert_same(_tables(pivot_by_group(compact, 'Method', INDEX, 'FieldName', 'Value', drop_duplicates)), expected,
+                 nulls_as_nan=True)
+
+
+def test_pivot_by_group_duplicate_entries():
+    long_df = pd.DataFrame({'EventID': ['E1', 'E1'], 'DataRow': ['R1', 'R1'], 'UnitSystem': ['Metric', 'Metric'],
+                            'FieldName': ['DBH', 'DBH'], 'Value': ['1', '2'], 'Method': ['Trees', 'Trees']})
+    with pytest.raises(ValueError, match='duplicate entries'):
+        list(pivot_by_group(long_df, 'Method', INDEX, 'FieldName', 'Value', drop_duplicates=True))
+
+
+def test_pivot_by_group_non_text_values():
+    long_df = _long_table(1)
+    long_df['Value'] = pd.to_numeric(long_df['Value'], errors='coerce')
+    _assert_same(_tables(pivot_by_group(long_df, 'Method', INDEX, 'FieldName', 'Value', True)),
+                 _tables(_masked(long_df, True)))
@@ -0,0 +1,40 @@
+import gc
+import os
+import time
+from sqlalchemy import create_engine
+import xml_to_rdb
+from benchmarks.pipeline_benchmark import create_standin_db
+from benchmarks.synthetic_export import write_export
+from parser.xml import FFIFile
+
+
+def test_run_pipelined_holds_at_most_depth_exports(tmp_path, monkeypatch):
+    data = tmp_path / 'data'
+    processed = data / 'processed'
+    processed.mkdir(parents=True)
+    for idx in range(4):
+        write_export(str(data / f'export{idx}.xml'), 300, seed=idx)
+    ffi_file = FFIFile(str(data / 'export0.xml'), streaming=True)
+    ffi_file.extract()
+    ffi_file.transform()
+    server = create_standin_db(create_engine('sqlite://'), ffi_file)
+    del ffi_file
+
+    # count the exports in memory each time the next one is waited on (with a moment for the others to come in)
+    held = []
+
+    def counting_wait(*args, **kwargs):
+        result = wait(*args, **kwargs)
+        time.sleep(0.2)
+        gc.collect()
+        held.append(sum(isinstance(obj, FFIFile) for obj in gc.get_objects()))
+        return result
+
+    wait = xml_to_rdb.wait
+    monkeypatch.setattr(xml_to_rdb, 'wait', counting_wait)
+    exports = sorted((entry for entry in os.scandir(data) if entry.is_file()), key=lambda entry: entry.name)
+
+    xml_to_rdb.run_pipelined(exports, 2, 2, {}, dict(server=server, processed=str(processed)))
+
+    assert len(os.listdir(processed)) == 4
+    assert max(held) <= 2
@@ -0,0 +1,93 @@
+import datetime
+from uuid import UUID
+import pandas as pd
+import pytest
+from sqlalchemy import Column, MetaData, Table, create_engine, select
+from sqlalchemy.dialects import mssql
+from sqlalchemy.orm import Session
+from sqlalchemy.types import Float, String
+from parser.loader import BulkLoader
+from parser.serialize import serialize_frame
+from parser.server import FFIDatabase
+
+GUID = '6F9619FF-8B86-D011-B42D-00C04FC964FF'
+
+
+def _mssql_table():
+    return Table('Trees', MetaData(),
+                 Column('Live', mssql.BIT), Column('Count', mssql.TINYINT), Column('Measured', mssql.DATETIME2),
+                 Column('Visited', mssql.DATE), Column('Row_GUID', mssql.UNIQUEIDENTIFIER),
+                 Column('Species', mssql.NVARCHAR(6)), Column('DBH', mssql.REAL), Column('Cover', mssql.DECIMAL(5, 2)))
+
+
+def test_serialize_frame_native_types():
+    df = pd.DataFrame({'Live': ['1', 'False', None],
+                       'Count': ['3', '4.0', ''],
+                       'Measured': ['2020-01-02T03:04:05', '2020-01-02T03:04:05.250', None],
+                       'Visited': ['2020-05-06', None, None],
+                       'Row_GUID': [GUID.lower(), f'{{{GUID}}}', None],
+                       'Species': ['PIPO', 'QUGA', None],
+                       'DBH': ['12.5', 'nan', None],
+                       'Cover': ['1.25', ' ', None],
+                       'Extra': ['a', None, 'c']})
+
+    result = serialize_frame(df, _mssql_table(), native_uuid=True)
+
+    assert result['Live'].tolist() == [True, False, None]
+    assert result['Count'].tolist() == [3, 4, None]
+    assert type(result['Count'][0]) is int
+    assert result['Measured'].tolist() == [datetime.datetime(2020, 1, 2, 3, 4, 5),
+                                           datetime.datetime(2020, 1, 2, 3, 4, 5, 250000), None]
+    assert result['Visited'].tolist() == [datetime.date(2020, 5, 6), None, None]
+    assert result['Row_GUID'].tolist() == [UUID(GUID), UUID(GUID), None]
+    assert result['Species'].tolist() == ['PIPO', 'QUGA', None]
+    assert result['DBH'].tolist() == [12.5, None, None]
+    assert result['Cover'].tolist() == [1.25, None, None]
+    assert result['Extra'].tolist() == ['a', None, 'c']
+    assert serialize_frame(df, _mssql_table())['Row_GUID'].tolist() == [GUID, GUID, None]
+
+
+@pytest.mark.parametrize('column, value', [('Count', 'abc'), ('Count', '2.5'), ('Live', 'maybe'),
+                                           ('Measured', 'not a date'), ('Row_GUID', 'zz'), ('DBH', 'x'),
+                                           ('Species', 'TOOLONG')])
+def test_serialize_frame_raises_on_values_that_dont_fit(column, value):
+    df = pd.DataFrame({column: [None, value]})
+    with pytest.raises(ValueError, match=f'{column}.*{value}'):
+        serialize_frame(df, _mssql_table())
+
+
+def test_bad_values_fail_the_load():
+    # a long key would have been cut short and merged into the existing row, and text in a number column sent as NULL
+    engine = create_engine('sqlite://')
+    meta = MetaData()
+    table = Table('Plot', meta, Column('PlotID', String(8), primary_key=True), Column('Slope', Float))
+    meta.create_all(engine)
+    ffi_db = FFIDatabase(engine)
+    loader = BulkLoader(ffi_db)
+
+    with Session(engine) as session:
+        loader.load_batches(session, 'Plot', pd.DataFrame({'PlotID': ['ADMINP01'], 'Slope': ['12']}))
+        for bad in [pd.DataFrame({'PlotID': ['ADMINP01X'], 'Slope': ['3']}),
+                    pd.DataFrame({'PlotID': ['ADMINP02'], 'Slope': ['steep']})]:
+            with pytest.raises(ValueError):
+                loader.load_batches(session, 'Plot', bad)
+
+    with engine.connect() as conn:
+        assert conn.execute(select(table)).fetchall() == [('ADMINP01', 12.0)]
+
+
+def test_serialize_frame_out_of_range_dates():
+    # datetime64 only holds years 1677-2262, but DATETIME2 takes these, and FFI uses 0001-01-01 for "no date"
+    df = pd.DataFrame({'Measured': ['0001-01-01T00:00:00-07:00', '9999-12-31T23:59:59.5', '1650-03-04T00:00:00',
+                                    '2020-01-02T03:04:05Z', ' '],
+                       'Visited': ['0001-01-01', '9999-12-31', '1650-03-04', '2020-05-06', None]})
+
+    result = serialize_frame(df, _mssql_table())
+
+    assert result['Measured'].tolist() == [datetime.datetime(1, 1, 1),
+                                           datetime.datetime(9999, 12, 31, 23, 59, 59, 500000),
+                                           datetime.datetime(1650, 3, 4), datetime.datetime(2020, 1, 2, 3, 4, 5), None]
+    assert result['Visited'].tolist() == [datetime.date(1, 1, 1), datetime.date(9999, 12, 31),
+                                          datetime.date(1650, 3, 4), datetime.date(2020, 5, 6), None]
+    with pytest.raises(ValueError, match='Measured'):
+        serialize_frame(pd.DataFrame({'Measured': ['0001-13-01']}), _mssql_table())
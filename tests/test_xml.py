@@ -0,0 +1,166 @@
+from functools import partial
+import pandas as pd
+from sqlalchemy import Column, MetaData, Table, create_engine, text
+from sqlalchemy.orm import Session
+from sqlalchemy.types import Float, String
+from benchmarks.pipeline_benchmark import create_standin_db
+from benchmarks.synthetic_export import write_export
+from parser.fingerprint import FingerprintStore
+from parser.keys import KeyCache
+from parser.loader import BulkLoader
+from parser.server import FFIDatabase
+from parser.xml import FFIFile
+
+SAMPLE_TABLES = ['SurfaceFuels_Duff_Litter_Sample', 'SurfaceFuels_1000Hr_Sample', 'SurfaceFuels_Fine_Sample',
+                 'SurfaceFuels_Vegetation_Sample', 'Trees_Individuals_Sample', 'Trees_Saplings_DiameterClass_Sample',
+                 'Trees_Seedlings_HeightClass_Sample']
+
+
+def _ffi_file(tables):
+    """
+    an FFIFile with its data map filled in directly, without reading any XML
+    """
+    ffi_file = FFIFile('fixture.xml', streaming=True)
+    for table, df in tables.items():
+        ffi_file[table] = df
+    return ffi_file
+
+
+def _sample_table(teams):
+    """
+    a _Sample table like _sample_to_many makes, with the columns every sample table has in common
+
+    :param teams: list of (event GUID, FieldTeam, EntryTeam)
+    """
+    return pd.DataFrame({'SampleData_SampleRow_GUID': [f'ROW{idx}' for idx in range(len(teams))],
+                         'SampleData_SampleEvent_GUID': [event for event, _, _ in teams],
+                         'SampleData_CreatedBy': 'someone',
+                         'FieldTeam': [field for _, field, _ in teams],
+                         'EntryTeam': [entry for _, _, entry in teams]})
+
+
+def test_process_events_combines_crews():
+    events = pd.DataFrame({'SampleEvent_GUID': ['E1', 'E2'],
+                           'SampleEvent_Plot_GUID': ['P1', 'P1'],
+                           'EventID': ['ADMINPLOT120200101', 'ADMINPLOT120210101']})
+    plots = pd.DataFrame({'MacroPlot_GUID': ['P1'], 'PlotID': ['ADMINPLOT1']})
+    tables = {'SampleEvent': events, 'MacroPlot': plots}
+    for table in SAMPLE_TABLES:
+        tables[table] = _sample_table([('E1', None, None)])
+    tables['SurfaceFuels_Duff_Litter_Sample'] = _sample_table([('E1', 'Smith, Jones', 'Smith')])
+    tables['SurfaceFuels_Fine_Sample'] = _sample_table([('E1', 'Jones/Lee', 'Chen')])
+    tables['Trees_Individuals_Sample'] = _sample_table([('E1', 'Lee', 'Lee'), ('E2', 'Smith', None)])
+    ffi_file = _ffi_file(tables)
+
+    ffi_file._process_events()
+
+    result = ffi_file['SampleEvent'].set_index('SampleEvent_GUID')
+    assert list(result.index) == ['E1', 'E2']
+    assert result.loc['E1', 'FuelsObserver'] == 'Smith, Jones, Lee'
+    assert result.loc['E1', 'FuelsRecorder'] == 'Smith, Chen'
+    assert result.loc['E1', 'TreeObserver'] == 'Lee'
+    assert result.loc['E1', 'TreeRecorder'] == 'Lee'
+    assert result.loc['E2', 'FuelsObserver'] == ''
+    assert result.loc['E2', 'TreeObserver'] == 'Smith'
+    # only the crew columns come along from the sample tables
+    assert 'FieldTeam' not in result.columns and 'SampleData_CreatedBy' not in result.columns
+    assert result.loc['E1', 'PlotID'] == 'ADMINPLOT1'
+
+
+def _project_tables():
+    """
+    two project units with three events, and six monitoring statuses covering each part of the VisitID
+    """
+    project_units = pd.DataFrame({'ProjectUnit_GUID': ['PU1', 'PU2'],
+                                  'ProjectUnit_Name': ['Burn Unit_12', 'North-Rim 2']})
+    statuses = pd.DataFrame({'MonitoringStatus_GUID': ['M1', 'M2', 'M3', 'M4', 'M5', 'M6'],
+                             'MonitoringStatus_ProjectUnit_GUID': ['PU1', 'PU1', 'PU1', 'PU2', 'PU2', 'PU2'],
+                             'MonitoringStatus_Prefix': ['01', '01', '01', ' 02 ', None, '03'],
+                             'MonitoringStatus_Base': ['Fire', 'Pre', 'Post', 'Fire', 'Year', 'Fire'],
+                             'MonitoringStatus_Suffix': ['Immediate', None, None, ' Post ', 'Year 5', None]})
+    links = pd.DataFrame({'MM_MonitoringStatus_GUID': ['M1', 'M2', 'M3', 'M4', 'M5'],
+                          'MM_SampleEvent_GUID': ['E1', 'E2', 'E3', 'E4', 'E4']})
+    events = pd.DataFrame({'SampleEvent_GUID': ['E1', 'E2', 'E3', 'E4'],
+                           'SampleEvent_Date': ['2020-05-01T10:00:00', '2020-06-01T10:00:00', '2020-09-01T10:00:00',
+                                                '2021-07-04T08:30:00']})
+    return {'ProjectUnit': project_units, 'MonitoringStatus': statuses, 'MM_MonitoringStatus_SampleEvent': links,
+            'SampleEvent': events}
+
+
+def test_project_ids():
+    names = pd.Series(['Burn Unit_12', 'North-Rim 2', '_ Spaced  Out _'])
+    assert FFIFile._project_ids(names).tolist() == ['BurnUnit12', 'North-Rim2', 'SpacedOut']
+
+
+def test_process_projects_visit_ids():
+    # golden output of the old row-by-row VisitID code, including the collision between M2 and M3 (the base is only
+    # kept when it's 'Fire', so Pre and Post visits in the same year get the same ID)
+    ffi_file = _ffi_file(_project_tables())
+    ffi_file['ProjectUnit']['ProjectID'] = FFIFile._project_ids(ffi_file['ProjectUnit']['ProjectUnit_Name'])
+
+    ffi_file._process_projects()
+
+    visits = ffi_file['ProjectVisit']
+    assert visits['MonitoringStatus_GUID'].tolist() == ['M1', 'M2', 'M3', 'M4', 'M5', 'M6']
+    assert visits['VisitID'].tolist() == ['BurnUnit12202001FireImm',
+                                          'BurnUnit12202001',
+                                          'BurnUnit12202001',
+                                          'North-Rim2202102FirePost',
+                                          'North-Rim22021NoneYear 5',
+                                          'North-Rim203Fire']
+
+    events = ffi_file['SampleEvent']
+    assert events['SampleEvent_GUID'].tolist() == ['E1', 'E2', 'E3', 'E4', 'E4']
+    assert events['VisitID'].tolist() == ['BurnUnit12202001FireImm', 'BurnUnit12202001', 'BurnUnit12202001',
+                                          'North-Rim2202102FirePost', 'North-Rim22021NoneYear 5']
+
+
+def test_save_fingerprints_only_for_inserted_rows(tmp_path):
+    engine = create_engine('sqlite://')
+    meta = MetaData()
+    Table('Trees', meta, Column('EventID', String(50), primary_key=True), Column('TagNo', Float, primary_key=True),
+          Column('DBH', Float))
+    meta.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO Trees VALUES ('E1', 1.0, 10.0)"))
+    ffi_db = FFIDatabase(engine)
+
+    ffi_file = FFIFile('fixture.xml', streaming=True, fingerprints=str(tmp_path / 'fingerprints.sqlite'))
+    store = ffi_file._fingerprints
+    # tree 1 changed in FFI since it was loaded, tree 2 is new
+    df = pd.DataFrame({'EventID': ['E1', 'E1'], 'TagNo': ['1', '2'], 'DBH': ['11', '12']})
+    row_keys = FingerprintStore.row_keys(df, ['EventID', 'TagNo'])
+    row_hashes = FingerprintStore.row_hashes(df)
+
+    with Session(engine) as sesh:
+        BulkLoader(ffi_db, batch_size=1).load_batches(
+            sesh, 'Trees', df, on_commit=partial(ffi_file._save_fingerprints, ffi_db, row_keys, row_hashes))
+
+    # the MERGE skipped tree 1, so it isn't recorded as being in the database as it is now
+    assert store.changed('Trees', row_keys, row_hashes).tolist() == [True, False]
+
+
+class _BrokenKeyCache(KeyCache):
+    """
+    a KeyCache that loses its connection reading the keys of one table
+    """
+
+    def _fetch(self, table_name, scope):
+        if table_name == 'Transect':
+            raise RuntimeError('lost the connection')
+        return super()._fetch(table_name, scope)
+
+
+def test_load_fails_just_the_table_when_checking_keys_fails(tmp_path):
+    write_export(str(tmp_path / 'small.xml'), 500)
+    ffi_file = FFIFile(str(tmp_path / 'small.xml'), streaming=True)
+    ffi_file.extract()
+    ffi_file.transform()
+    ffi_db = create_standin_db(create_engine('sqlite://'), ffi_file)
+
+    # one table at a time, which is where an error used to stop the whole run
+    ffi_file.load(ffi_db, workers=1, key_cache=_BrokenKeyCache(ffi_db))
+
+    assert ffi_file.insert_failed == ['Transect']
+    with ffi_db.engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM TreesIndv')).scalar() > 0
@@ -1,10 +1,15 @@
+import argparse
 import configparser
 import shutil
 import logging
-from sqlalchemy import create_engine
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from parser.xml import *
 from parser.functions import create_url
-from parser.server import FFIDatabase
+from parser.server import FFIDatabase, SchemaCache
+from parser.mapping import get_registry
+from parser.cache import ExportCache
+from parser.keys import KeyCache
+from parser.metrics import profiled
 
 # logging
 logging.basicConfig(filename='C:/Users/Corey/OneDrive/OneDrive - New Mexico Highlands University/Python/FFI/XMLToCustom/log/data.log',
@@ -12,12 +17,148 @@ logging.basicConfig(filename='C:/Users/Corey/OneDrive/OneDrive - New Mexico High
                     datefmt='%d-%b-%y %H:%M')
 
 
-def main():
+def extract_transform(file, fingerprints=None, cache=None, cache_transformed=False, compact=False, report_memory=False,
+                      profile_dir=None):
+    """
+    Reads and transforms one export. This is the CPU-heavy part, so with --workers it runs in a worker process and the
+    FFIFile gets sent back to the main process to be loaded.
+
+    :param file: path to the XML export
+    :param fingerprints: optional path to the fingerprint store, to only load new or changed rows
+    :param cache: optional ExportCache for the extracted tables
+    :param cache_transformed: also cache the transformed tables
+    :param compact: store the big extracted tables with categorical/pyarrow string columns to save memory
+    :param report_memory: log how much memory each table takes after extracting and after transforming
+    :param profile_dir: optional directory to write a cProfile of the extract and transform to
+    """
+    ffi_data = FFIFile(file, streaming=True, fingerprints=fingerprints, compact=compact)
+    cache_transformed = cache is not None and cache_transformed
+
+    if cache_transformed and cache.restore(ffi_data, 'transform'):
+        return ffi_data
+
+    with profiled(profile_path(profile_dir, ffi_data, 'transform')):
+        ffi_data.extract(cache=cache)
+        if report_memory:
+            log_memory(ffi_data, 'extract')
+        ffi_data.transform()
+        if report_memory:
+            log_memory(ffi_data, 'transform')
+    if cache_transformed:
+        cache.store(ffi_data, 'transform')
+    return ffi_data
+
+
+def profile_path(profile_dir, ffi_data, stage):
+    """
+    :return: where to write the cProfile of a stage of an export, or None if not profiling
+    """
+    return os.path.join(profile_dir, f'{ffi_data.file}_{stage}.prof') if profile_dir else None
+
+
+def log_memory(ffi_data, stage):
+    """
+    Logs the per-table memory report for an export
+    """
+    report = ffi_data.memory_report()
+    print(f"{ffi_data.file} uses {report['MB'].sum():.1f} MB after {stage}")
+    logging.info(f"Memory use for {ffi_data.file} after {stage} ({report['MB'].sum():.1f} MB total):\n"
+                 f"{report.to_string(index=False, float_format='{:.1f}'.format)}")
+
+
+def load_export(ffi_data, export, server, processed, report_dir=None, profile_dir=None, **load_args):
+    """
+    Loads a transformed export, then moves it to processed/ if every table made it in
+
+    :param report_dir: optional directory to write the export's stage timings to, as <file>.json
+    :param profile_dir: optional directory to write a cProfile of the load to
+    """
+    with profiled(profile_path(profile_dir, ffi_data, 'load')):
+        ffi_data.load(server, **load_args)
+
+    logging.info(f"Stage timings for {ffi_data.file}:\n{ffi_data.metrics.summary()}")
+    if report_dir:
+        logging.info(f"Wrote stage timings to {ffi_data.metrics.write(report_dir)}")
+
+    if len(ffi_data.insert_failed) == 0:
+        shutil.move(export.path, os.path.join(processed, export.name))
+        logging.info(f"Moved {export.name} to processed folder")
+    else:
+        logging.warning(f"{export.name} failed to fully upload. Issues with the following tables: "
+                        f"{','.join(ffi_data.insert_failed)}. Review log.")
+
+
+def load_next(in_flight, load_args):
+    """
+    Waits for the next export to finish transforming and loads it. This is its own function so that nothing refers to
+    the export (or its future) once it's loaded; otherwise it would still be in memory while run_pipelined waits for
+    the next ones, making one more than the limit.
+
+    :param in_flight: dict of future -> export for the files being extracted and transformed
+    :param load_args: keyword arguments for load_export
+    """
+    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    future = next(future for future in in_flight if future in done)
+    export = in_flight.pop(future)
+    try:
+        ffi_data = future.result()
+    except Exception:
+        # the file stays in data/ for the next run
+        print(f"Failed to read {export.name}")
+        logging.exception(f"Failed to extract/transform {export.name}")
+        return
+    load_export(ffi_data, export, **load_args)
+
+
+def run_pipelined(xml_files, depth, workers, extract_args, load_args):
+    """
+    Extracts and transforms the next exports in worker processes while the current one is loading, so neither the CPU
+    nor the database sits idle waiting on the other. At most `depth` exports are held at once, counting the one being
+    loaded; the next file isn't started until there's room. Exports are loaded one at a time, in the order they finish
+    transforming, the same way as the other run modes.
+
+    :param xml_files: os.DirEntry for each export
+    :param depth: most exports in memory at once (2 or more for any overlap)
+    :param workers: processes extracting and transforming
+    :param extract_args: keyword arguments for extract_transform
+    :param load_args: keyword arguments for load_export
+    """
+    remaining = iter(xml_files)
+    in_flight = {}  # future -> export, in the order they were submitted
+
+    with ProcessPoolExecutor(max_workers=max(min(workers, depth), 1)) as pool:
+        while True:
+            # nothing is loading at this point, so fill every slot
+            while len(in_flight) < depth and (export := next(remaining, None)) is not None:
+                print(f"Processing {export.name}")
+                logging.info(f"Reading in {export.name}")
+                in_flight[pool.submit(extract_transform, export.path, **extract_args)] = export
+            if not in_flight:
+                break
+
+            # the files still in flight keep transforming while this one loads
+            load_next(in_flight, load_args)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Load FFI XML exports from data/ into the database.')
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help='number of exports to extract and transform at the same time, each in its own '
+                                 'process, holding at most twice as many in memory. Loads still go into the database '
+                                 'one file at a time.')
+    arg_parser.add_argument('--pipeline', type=int, default=0, metavar='K',
+                            help='extract and transform the next files while the current one loads, holding at most K '
+                                 'exports in memory at once (counting the one loading). Uses --workers processes.')
+    args = arg_parser.parse_args(argv)
+
     # Make sure you have a data/ directory in the main directory for this project before running.
     data_path = 'data'
     base_path = os.getcwd()
     path = os.path.join(base_path, data_path)
 
+    # read and check the table/field maps before doing anything else
+    registry = get_registry()
+
     # users need to create their own local config file (see README)
     config = configparser.ConfigParser()
     config.read('config.ini')
@@ -25,10 +166,58 @@ def main():
     # create database connection
     sql_config = config['LocalMSSQL']
     sql_url = create_url(**sql_config)
-    sql_engine = create_engine(sql_url)
-    server = FFIDatabase(sql_engine)
+
+    # rows per MERGE, and how many independent tables to load at once
+    batch_size = config.getint('Load', 'batch_size', fallback=10000)
+    load_workers = config.getint('Load', 'workers', fallback=4)
+
+    # pyodbc can send a whole executemany batch in one round trip, which the bulk loader relies on for speed
+    engine_kwargs = {'fast_executemany': True} if 'pyodbc' in sql_url else {}
+
+    # optionally keep the reflected schema on disk, and/or only reflect the tables the exports load into
+    schema_cache = None
+    if config.has_option('Schema', 'cache_directory'):
+        schema_cache = SchemaCache(config.get('Schema', 'cache_directory'))
+    only = None
+    if config.getboolean('Schema', 'mapped_only', fallback=False):
+        only = sorted(set(table for table in registry.table_map.values() if isinstance(table, str)))
+
+    server = FFIDatabase.from_url(sql_url, pool_size=load_workers, schema_cache=schema_cache, only=only,
+                                  **engine_kwargs)
     logging.info(f"Connected to {sql_config['server']} : {sql_config['database']}")
 
+    # keeps track of committed batches so failed loads can be resumed
+    checkpoint_path = os.path.join(path, 'load_checkpoint.json')
+
+    # optional record of every row loaded so far, so re-exports only send what's new or changed
+    fingerprints = config.get('Load', 'fingerprints', fallback=None)
+
+    # optionally read the keys already in the database once per run, so rows that are already there aren't sent
+    key_cache = KeyCache(server) if config.getboolean('Load', 'prefetch_keys', fallback=False) else None
+
+    # optional on-disk cache of parsed exports, so files that fail to load don't need to be parsed again
+    cache = None
+    cache_transformed = False
+    if config.has_section('Cache'):
+        if ExportCache.available():
+            cache = ExportCache(config.get('Cache', 'directory', fallback=os.path.join(path, 'cache')),
+                                max_age_days=config.getfloat('Cache', 'max_age_days', fallback=30),
+                                max_size_mb=config.getfloat('Cache', 'max_size_mb', fallback=20000))
+            cache_transformed = config.getboolean('Cache', 'transformed', fallback=False)
+        else:
+            logging.warning("The export cache needs pyarrow, which isn't installed. Not caching.")
+
+    # categorical/pyarrow string columns for the big tables, and an optional per-table memory report
+    compact = config.getboolean('Memory', 'compact', fallback=False)
+    report_memory = config.getboolean('Memory', 'report', fallback=False)
+
+    # optional per-stage timings (JSON, one file per export) and cProfile output (.prof, for pstats or snakeviz)
+    report_dir = config.get('Profile', 'report_dir', fallback=None)
+    profile_dir = report_dir if config.getboolean('Profile', 'cprofile', fallback=False) else None
+
+    extract_args = {'fingerprints': fingerprints, 'cache': cache, 'cache_transformed': cache_transformed,
+                    'compact': compact, 'report_memory': report_memory, 'profile_dir': profile_dir}
+
     if not os.path.isdir(processed := os.path.join(path, 'processed')):
         os.mkdir(processed)
 
@@ -36,25 +225,25 @@ def main():
                  if f.is_file()
                  and '.xml' in f.path]
 
-    for export in xml_files:
+    load_args = {'batch_size': batch_size, 'checkpoint_path': checkpoint_path, 'workers': load_workers,
+                 'key_cache': key_cache, 'report_dir': report_dir, 'profile_dir': profile_dir}
 
-        file = export.path
-        print(f"Processing {export.name}")
-        logging.info(f"Reading in {export.name}")
-
-        ffi_data = FFIFile(export)
-
-        ffi_data.extract()
-        ffi_data.transform()
-        ffi_data.load(server)
-
-        if len(ffi_data.insert_failed) == 0:
-            shutil.move(file, os.path.join(processed, export.name))
-            logging.info(f"Moved {export.name} to processed folder")
-        else:
-            logging.warning(f"{export.name} failed to fully upload. Issues with the following tables: "
-                            f"{','.join(ffi_data.insert_failed)}. Review log.")
+    if args.pipeline > 0:
+        run_pipelined(xml_files, args.pipeline, args.workers, extract_args,
+                      dict(server=server, processed=processed, **load_args))
+    elif args.workers > 1:
+        # Extract and transform in parallel, then load each file as it's ready. Loading only happens here in the main
+        # process, so the database only ever gets one file at a time. Files are submitted as others finish loading,
+        # so at most two per worker are held in memory at once rather than every export in the folder.
+        run_pipelined(xml_files, 2 * args.workers, args.workers, extract_args,
+                      dict(server=server, processed=processed, **load_args))
+    else:
+        for export in xml_files:
+            print(f"Processing {export.name}")
+            logging.info(f"Reading in {export.name}")
 
+            ffi_data = extract_transform(export.path, **extract_args)
+            load_export(ffi_data, export, server, processed, **load_args)
 
 if __name__ == "__main__":
     main()